@@ -0,0 +1,171 @@
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Iterable, Optional
+from urllib.parse import urlsplit
+from http_fetcher import (BlockedError, ContentMissingError, FetchError, HttpFetcher,
+                          check_hotel_page, check_review_page, review_page_url)
+from metrics import metrics
+from parser_booking import HotelSnapshot, has_booking_reviews
+
+retryable_status = {500, 502, 503, 504}  # 429 is a block, see BlockedError
+
+
+class TokenBucket:
+    # allow `rate` requests per second on average, with bursts up to `capacity`
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity,
+                                   self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AsyncCrawlEngine:
+    def __init__(self,
+                 fetcher: HttpFetcher,
+                 concurrency: int = 100,
+                 rate_per_host: float = 10,
+                 max_retries: int = 3,
+                 backoff_base: float = 0.5,
+                 backoff_max: float = 30,
+                 page_window: int = 4):
+        self.fetcher = fetcher
+        self.concurrency = concurrency  # requests in flight over all hosts
+        self.rate_per_host = rate_per_host  # requests per second per host
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.page_window = page_window  # review pages of a hotel fetched at once
+        self.retry_count = 0
+        # urllib3 is blocking, every request in flight holds a thread
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._buckets: dict[str, TokenBucket] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _bucket(self, url: str) -> TokenBucket:
+        host = urlsplit(url).netloc
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(self.rate_per_host)
+        return self._buckets[host]
+
+    def _backoff(self, attempt: int) -> float:
+        # exponential backoff with full jitter
+        return random.uniform(0, min(self.backoff_max,
+                                     self.backoff_base * 2 ** attempt))
+
+    async def fetch(self, url: str) -> str:
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries + 1):
+            await self._bucket(url).acquire()
+            async with self._semaphore:
+                try:
+                    return await loop.run_in_executor(self._executor,
+                                                      self.fetcher.get, url)
+                except (ContentMissingError, BlockedError):
+                    raise  # blocks go to the crawl controller, for the cooldown
+                except FetchError as e:
+                    if attempt >= self.max_retries or \
+                            (e.status is not None and e.status not in retryable_status):
+                        raise
+            self.retry_count += 1
+            metrics.inc("fetch_retries")
+            await asyncio.sleep(self._backoff(attempt))
+
+    async def get_snapshot(self,
+                           url: str,
+                           max_page: int,
+                           snapshot: Optional[HotelSnapshot] = None,
+                           on_page: Optional[Callable[[int, str], None]] = None,
+                           stop_page: Optional[Callable[[str], bool]] = None):
+        # same as get_snapshot_over_http, with review pages fetched
+        # concurrently in windows of page_window pages
+        snapshot = snapshot or HotelSnapshot(url)
+        on_page = on_page or (lambda page, html: None)
+        if len(snapshot.review_pages) >= max_page:
+            return snapshot
+
+        if not snapshot.hotel_html:
+            hotel_html = await self.fetch(url)
+            check_hotel_page(url, hotel_html)
+            snapshot.hotel_html = hotel_html
+            on_page(0, snapshot.hotel_html)
+
+        if not has_booking_reviews(snapshot.hotel_html):
+            return snapshot
+
+        # incremental mode checks every page before asking for the next
+        window = 1 if stop_page else self.page_window
+        while len(snapshot.review_pages) < max_page:
+            first_page = len(snapshot.review_pages) + 1
+            pages = range(first_page,
+                          min(first_page + window, max_page + 1))
+            page_urls = [review_page_url(url, page) for page in pages]
+            htmls = await asyncio.gather(*[self.fetch(page_url)
+                                           for page_url in page_urls])
+            for page, page_url, html in zip(pages, page_urls, htmls):
+                if not check_review_page(page_url, html):
+                    return snapshot  # no more review
+                snapshot.review_pages.append(html)
+                on_page(page, html)
+                if stop_page and stop_page(html):
+                    return snapshot
+        return snapshot
+
+    async def _run(self,
+                   items: Iterable,
+                   handle: Callable[..., Awaitable],
+                   max_items_in_flight: int):
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        hotel_slots = asyncio.Semaphore(max_items_in_flight)
+
+        async def run_item(item):
+            try:
+                await handle(*item)
+            finally:
+                hotel_slots.release()
+
+        # items may be a generator blocking on the harvest of search results,
+        # it is read in a thread, one item per free hotel slot
+        iterator = iter(items)
+        tasks = list()
+        while True:
+            await hotel_slots.acquire()
+            item = await asyncio.to_thread(next, iterator, None)
+            if item is None:
+                hotel_slots.release()
+                break
+            tasks.append(asyncio.create_task(run_item(item)))
+        await asyncio.gather(*tasks)
+
+    def run(self,
+            items: Iterable,
+            handle: Callable[..., Awaitable],
+            max_items_in_flight: Optional[int] = None):
+        # run handle(*item) for every item on an event loop, the handle
+        # should catch its own errors
+        try:
+            asyncio.run(self._run(items,
+                                  handle,
+                                  max_items_in_flight or
+                                  max(1, self.concurrency // self.page_window)))
+        finally:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def print_summary(self):
+        print(f"Async engine: concurrency {self.concurrency}, " +
+              f"{self.rate_per_host} requests/s per host, " +
+              f"{self.retry_count} retries.")
@@ -0,0 +1,160 @@
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from driver_pool import blocking_preset_mapping, create_chrome_driver  # noqa: E402
+from parser_booking import parse_hotel_page, parse_review_page  # noqa: E402
+
+fixture_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+page_fixtures = ["hotel_subratings", "review_page_1"]
+
+# assets of a real booking.com page, (content type, size in bytes)
+asset_mapping = {
+    "/static/css/main.css": ("text/css", 120 * 1024),
+    "/static/js/main.js": ("application/javascript", 300 * 1024),
+    "/static/fonts/booking.woff2": ("font/woff2", 90 * 1024),
+    "/static/fonts/booking-bold.woff2": ("font/woff2", 90 * 1024),
+    "/static/video/tour.mp4": ("video/mp4", 800 * 1024),
+    "/www.google-analytics.com/analytics.js": ("application/javascript", 50 * 1024),
+    "/www.googletagmanager.com/gtm.js": ("application/javascript", 110 * 1024),
+    "/connect.facebook.net/fbevents.js": ("application/javascript", 90 * 1024),
+    **{f"/static/images/photo{i}.jpg": ("image/jpeg", 150 * 1024) for i in range(10)}
+}
+
+asset_tags = "".join([
+    '<link rel="preload" href="/static/fonts/booking.woff2" as="font" crossorigin>',
+    '<style>@font-face{font-family:b;src:url(/static/fonts/booking-bold.woff2)}' +
+    'body{font-family:b}</style>',
+    '<script async src="/www.google-analytics.com/analytics.js"></script>',
+    '<script async src="/www.googletagmanager.com/gtm.js"></script>',
+    '<script async src="/connect.facebook.net/fbevents.js"></script>',
+    '<video src="/static/video/tour.mp4" preload="auto"></video>',
+    *[f'<img src="/static/images/photo{i}.jpg">' for i in range(10)]
+])
+
+
+def read_fixture(name: str) -> str:
+    with open(os.path.join(fixture_dir, f"{name}.html"), "r", encoding='utf8') as file:
+        return file.read()
+
+
+class FixtureServer:
+    # local server of the fixture pages with their assets, counting the
+    # requests and bytes sent since the last reset
+    def __init__(self):
+        self.request_count = 0
+        self.byte_count = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path.startswith("/page/"):
+                    html = read_fixture(path[len("/page/"):])
+                    body = html.replace("</head>", asset_tags + "</head>").encode("utf8")
+                    content_type = "text/html; charset=utf-8"
+                elif path in asset_mapping:
+                    content_type, size = asset_mapping[path]
+                    body = b"/" * size if "javascript" in content_type or \
+                        "css" in content_type else b"\0" * size
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Cache-Control", "no-store")
+                self.end_headers()
+                self.wfile.write(body)
+                with server._lock:
+                    server.request_count += 1
+                    server.byte_count += len(body)
+
+            def log_message(self, format, *args):
+                None
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self._server.server_port}"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def reset(self):
+        with self._lock:
+            self.request_count = 0
+            self.byte_count = 0
+
+    def close(self):
+        self._server.shutdown()
+
+
+def selectors_ok(name: str, html: str) -> bool:
+    # the blocked page still holds what the crawler extracts
+    with contextlib.redirect_stdout(io.StringIO()):
+        if name.startswith("hotel"):
+            expected = parse_hotel_page(read_fixture(name)).to_dict()
+            return parse_hotel_page(html).to_dict() == expected
+        expected = [review.to_dict() for review in parse_review_page(read_fixture(name))]
+        return [review.to_dict() for review in parse_review_page(html)] == expected
+
+
+def measure_preset(server: FixtureServer, preset: str, repeat: int, headless: bool) -> dict:
+    driver = create_chrome_driver(headless=headless,
+                                  blocked_urls=blocking_preset_mapping[preset])
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setCacheDisabled", {"cacheDisabled": True})
+        results = dict()
+        for name in page_fixtures:
+            load_times, byte_counts, request_counts = list(), list(), list()
+            ok = True
+            for _ in range(repeat):
+                server.reset()
+                driver.get(f"{server.base_url}/page/{name}")
+                load_times.append(driver.execute_script(
+                    "const nav = performance.getEntriesByType('navigation')[0];" +
+                    "return nav.loadEventEnd - nav.startTime;"))
+                byte_counts.append(server.byte_count)
+                request_counts.append(server.request_count)
+                ok = ok and selectors_ok(name, driver.page_source)
+            results[name] = {"load_ms": statistics.median(load_times),
+                             "kib": statistics.median(byte_counts) / 1024,
+                             "requests": statistics.median(request_counts),
+                             "selectors_ok": ok}
+        return results
+    finally:
+        driver.quit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure bytes and load time of pages with every blocking preset.")
+    parser.add_argument("-r", "--repeat", type=int,
+                        help="Number of loads of every page.", default=5)
+    parser.add_argument("-b", "--block", type=str, nargs="+",
+                        choices=list(blocking_preset_mapping),
+                        help="Presets to measure.", default=list(blocking_preset_mapping))
+    parser.add_argument("--headed", action="store_true",
+                        help="Run chrome with window.")
+    args = parser.parse_args()
+
+    server = FixtureServer()
+    try:
+        results = {preset: measure_preset(server, preset, args.repeat, not args.headed)
+                   for preset in args.block}
+    finally:
+        server.close()
+
+    print(f"{'preset':<12}{'page':<20}{'load ms':>10}{'KiB':>10}{'requests':>10}  selectors")
+    for preset, pages in results.items():
+        for name, item in pages.items():
+            print(f"{preset:<12}{name:<20}{item['load_ms']:>10.1f}{item['kib']:>10.1f}" +
+                  f"{item['requests']:>10}  {'ok' if item['selectors_ok'] else 'BROKEN'}")
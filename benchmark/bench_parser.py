@@ -0,0 +1,194 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_model_booking import BookingData  # noqa: E402
+from parser_booking import (HotelSnapshot, make_soup, parse_hotel_page,  # noqa: E402
+                            parse_review_page, parse_snapshot,
+                            review_field_extractors, set_parser_backend)
+from selector_booking import selector_mapping, selector_version  # noqa: E402
+
+fixture_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+default_baseline_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                     "baseline.json")
+
+hotel_fixtures = ["hotel_no_review", "hotel_external_rating", "hotel_subratings"]
+review_fixtures = ["review_page_1", "review_page_2", "review_page_3", "review_list"]
+
+
+def read_fixture(name: str) -> str:
+    with open(os.path.join(fixture_dir, f"{name}.html"), "r", encoding='utf8') as file:
+        return file.read()
+
+
+def measure(func, repeat: int) -> float:
+    # median seconds of one call
+    timings = list()
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start_time)
+    return statistics.median(timings)
+
+
+def peak_memory(func) -> int:
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_benchmarks(repeat: int) -> dict:
+    results = dict()
+
+    def add(name: str, value: float, unit: str, better: str = "lower"):
+        results[name] = {"value": round(value, 6), "unit": unit, "better": better}
+
+    # hotel pages
+    for name in hotel_fixtures:
+        html = read_fixture(name)
+        add(f"hotel_page.{name}", measure(lambda: parse_hotel_page(html),
+                                          repeat) * 1000, "ms")
+
+    # review pages
+    for name in review_fixtures:
+        html = read_fixture(name)
+        review_count = len(parse_review_page(html))
+        elapsed = measure(lambda: parse_review_page(html), repeat)
+        add(f"review_page.{name}", elapsed * 1000, "ms")
+        add(f"review_page.{name}.reviews_per_second",
+            review_count / elapsed, "reviews/s", "higher")
+
+    # per-field extraction over every review card of the fixtures
+    review_divs = list()
+    for name in review_fixtures[:3]:
+        review_section = selector_mapping["review_list"].find(
+            make_soup(read_fixture(name), "review_list"))
+        review_divs.extend(selector_mapping["review_card"].find_all(review_section))
+
+    def extract_all(extract):
+        for review_div in review_divs:
+            try:
+                extract(review_div)
+            except Exception:
+                None  # broken review card of fixture
+
+    for field, extract in review_field_extractors:
+        add(f"field.{field}",
+            measure(lambda: extract_all(extract), repeat) / len(review_divs) * 1e6,
+            "us/review")
+
+    # whole hotel, as done by the parse pipeline
+    snapshot = HotelSnapshot("https://www.booking.com/hotel/jp/fixture.zh-tw.html",
+                             read_fixture("hotel_subratings"),
+                             [read_fixture(name) for name in review_fixtures[:3]])
+    data = parse_snapshot(snapshot)
+    review_count = len(data.user_review.reviews)
+    elapsed = measure(lambda: parse_snapshot(snapshot), repeat)
+    add("snapshot.parse", elapsed * 1000, "ms")
+    add("snapshot.reviews_per_second", review_count / elapsed, "reviews/s", "higher")
+    add("snapshot.peak_memory", peak_memory(lambda: parse_snapshot(snapshot)) / 1024,
+        "KiB")
+
+    # data model, a large hotel encoded to json
+    large_count = 10000
+    reviews = (data.user_review.reviews * (large_count // review_count + 1))[:large_count]
+
+    def build_large():
+        large = BookingData.from_dict(data.to_dict())
+        large.user_review.reviews = [type(review).from_dict(review.to_dict())
+                                     for review in reviews]
+        return large
+
+    add("model.memory_per_review", peak_memory(build_large) / large_count, "B/review")
+    large = build_large()
+    elapsed = measure(lambda: json.dumps(large.to_dict(), ensure_ascii=False),
+                      max(1, repeat // 10))
+    add("model.to_json_reviews_per_second", large_count / elapsed, "reviews/s", "higher")
+    add("model.to_json_peak_memory",
+        peak_memory(lambda: json.dumps(large.to_dict(), ensure_ascii=False)) / 1024,
+        "KiB")
+
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    # print every result next to its baseline, return the regressed ones
+    regressions = list()
+    print(f"{'benchmark':<48}{'value':>14}{'baseline':>14}{'change':>10}")
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        line = f"{name:<48}{result['value']:>14.3f}"
+        if not base or not base["value"]:
+            print(line + f"{'-':>14}{'-':>10}  {result['unit']}")
+            continue
+        change = result["value"] / base["value"] - 1
+        regressed = change > tolerance if result["better"] == "lower" \
+            else change < -tolerance
+        if regressed:
+            regressions.append(name)
+        print(line + f"{base['value']:>14.3f}{change:>+10.1%}  {result['unit']}" +
+              ("  REGRESSION" if regressed else ""))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the extraction code over recorded page fixtures.")
+    parser.add_argument("-r", "--repeat", type=int,
+                        help="Number of runs of every benchmark.", default=20)
+    parser.add_argument("-p", "--parser", type=str, choices=["html.parser", "lxml"],
+                        help="HTML parser backend.", default="html.parser")
+    parser.add_argument("-b", "--baseline", type=str,
+                        help="Path of baseline file.", default=default_baseline_path)
+    parser.add_argument("-s", "--save_baseline", action="store_true",
+                        help="Save the results as the new baseline.")
+    parser.add_argument("-t", "--tolerance", type=float,
+                        help="Allowed change against baseline before a " +
+                        "regression is reported.", default=0.2)
+    args = parser.parse_args()
+
+    set_parser_backend(args.parser)
+    with contextlib.redirect_stdout(io.StringIO()):  # silence parser prints
+        results = run_benchmarks(args.repeat)
+
+    baseline = dict()
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding='utf8') as file:
+            baseline = json.load(file)
+        meta = baseline.get("meta", {})
+        print(f"Baseline of {meta.get('created_at')} " +
+              f"(parser: {meta.get('parser')}, selector: {meta.get('selector_version')}).")
+        if meta.get("parser") != args.parser:
+            print(f"Warning: baseline is measured with parser {meta.get('parser')}.")
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding='utf8') as file:
+            json.dump({
+                "meta": {
+                    "created_at": datetime.now().isoformat(timespec="seconds"),
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "parser": args.parser,
+                    "selector_version": selector_version
+                },
+                "results": results
+            }, file, ensure_ascii=False, indent=4)
+        print(f"Baseline saved to '{args.baseline}'.")
+    elif regressions:
+        print(f"{len(regressions)} regressions over {args.tolerance:.0%} " +
+              "against baseline.")
+        sys.exit(1)
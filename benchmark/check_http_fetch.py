@@ -0,0 +1,167 @@
+import argparse
+import contextlib
+import io
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from async_engine import AsyncCrawlEngine  # noqa: E402
+from http_fetcher import (BlockedError, ContentMissingError, HttpFetcher,  # noqa: E402
+                          get_snapshot_over_http)
+from parser_booking import HotelSnapshot, parse_snapshot  # noqa: E402
+
+fixture_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+review_fixtures = ["review_page_1", "review_page_2", "review_page_3"]
+
+# hotel page path name: fixture served for it
+hotel_fixture_mapping = {
+    "subratings": "hotel_subratings",
+    "external": "hotel_external_rating",
+    "no-review": "hotel_no_review"
+}
+empty_review_list = '<div class="b89e77822a"></div>'  # after the last review page
+challenge_page = '<html><script>window.gokuProps = {};</script>' + \
+    '<div id="challenge-container"></div></html>'
+
+
+def read_fixture(name: str) -> str:
+    with open(os.path.join(fixture_dir, f"{name}.html"), "r", encoding='utf8') as file:
+        return file.read()
+
+
+class FixtureSiteServer:
+    # local stand-in of booking.com for the browserless fetch: hotel pages at
+    # /hotel/jp/<name>.zh-tw.html and their review pages at
+    # /reviewlist.zh-tw.html?pagename=<name>&offset=..&rows=..
+    def __init__(self):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                query = parse_qs(parts.query)
+                html = None
+                if parts.path.startswith("/hotel/"):
+                    name = parts.path.split("/")[-1].split(".")[0]
+                    if name == "blocked":
+                        html = challenge_page
+                    elif name == "empty":
+                        html = "<html></html>"  # content rendered by javascript
+                    elif name in hotel_fixture_mapping:
+                        html = read_fixture(hotel_fixture_mapping[name])
+                elif parts.path == "/reviewlist.zh-tw.html":
+                    page = int(query["offset"][0]) // int(query["rows"][0])
+                    html = read_fixture(review_fixtures[page]) \
+                        if page < len(review_fixtures) else empty_review_list
+                if html is None:
+                    self.send_error(404)
+                    return
+                body = html.encode("utf8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                None
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self._server.server_port}"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def hotel_url(self, name: str) -> str:
+        return f"{self.base_url}/hotel/jp/{name}.zh-tw.html"
+
+    def close(self):
+        self._server.shutdown()
+
+
+def expected_snapshot(url: str, fixture: str, review_pages: list[str]) -> HotelSnapshot:
+    snapshot = HotelSnapshot(url)
+    snapshot.hotel_html = read_fixture(fixture)
+    snapshot.review_pages = [read_fixture(name) for name in review_pages]
+    return snapshot
+
+
+def check_snapshot(label: str, snapshot: HotelSnapshot, expected: HotelSnapshot) -> bool:
+    if snapshot is None:
+        print(f"{'FAILED':<8}{label}: no snapshot")
+        return False
+    with contextlib.redirect_stdout(io.StringIO()):
+        data, expected_data = parse_snapshot(snapshot), parse_snapshot(expected)
+    ok = snapshot.hotel_html == expected.hotel_html and \
+        snapshot.review_pages == expected.review_pages and \
+        data.to_dict() == expected_data.to_dict()
+    print(f"{'ok' if ok else 'FAILED':<8}{label}: {len(snapshot.review_pages)} review pages, " +
+          f"{len(data.user_review.reviews)} reviews")
+    return ok
+
+
+def check_error(label: str, func, error_type) -> bool:
+    try:
+        func()
+        ok = False
+    except error_type:
+        ok = True
+    except Exception:
+        ok = False
+    print(f"{'ok' if ok else 'FAILED':<8}{label}: raises {error_type.__name__}")
+    return ok
+
+
+def run_checks(max_page: int) -> bool:
+    server = FixtureSiteServer()
+    fetcher = HttpFetcher(4, retries=0)
+    engine = AsyncCrawlEngine(fetcher, concurrency=8, rate_per_host=1000)
+    cases = [("subratings", "hotel_subratings", review_fixtures[:max_page]),
+             ("external", "hotel_external_rating", []),
+             ("no-review", "hotel_no_review", [])]
+    results = list()
+    try:
+        snapshots = dict()
+        for name, fixture, review_pages in cases:
+            url = server.hotel_url(name)
+            with contextlib.redirect_stdout(io.StringIO()):
+                snapshots[("http", name)] = get_snapshot_over_http(fetcher, url, max_page)
+
+        async def get_snapshot(name: str):
+            snapshots[("async", name)] = await engine.get_snapshot(
+                server.hotel_url(name), max_page)
+        with contextlib.redirect_stdout(io.StringIO()):
+            engine.run([(name,) for name, _, _ in cases], get_snapshot)
+
+        for name, fixture, review_pages in cases:
+            expected = expected_snapshot(server.hotel_url(name), fixture, review_pages)
+            for path in ("http", "async"):
+                results.append(check_snapshot(f"{path} {name}",
+                                              snapshots.get((path, name)), expected))
+
+        results.append(check_error(
+            "http challenge page",
+            lambda: get_snapshot_over_http(fetcher, server.hotel_url("blocked"), max_page),
+            BlockedError))
+        results.append(check_error(
+            "http hotel header missing",
+            lambda: get_snapshot_over_http(fetcher, server.hotel_url("empty"), max_page),
+            ContentMissingError))
+    finally:
+        fetcher.close()
+        server.close()
+    return all(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check the browserless fetch (--fetch http, --engine async) " +
+        "against a local server of the page fixtures.")
+    parser.add_argument("-mp", "--max_page", type=int,
+                        help="Number of max review page.", default=999)
+    args = parser.parse_args()
+
+    if not run_checks(args.max_page):
+        sys.exit(1)
@@ -0,0 +1,212 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Callable, Optional
+from selenium.common.exceptions import (NoSuchElementException, TimeoutException,
+                                        WebDriverException)
+from http_fetcher import BlockedError, FetchError
+from metrics import metrics
+
+failure_kinds = ("transient", "block", "parse_drift")
+retried_kinds = ("transient", "block")
+
+
+def classify_failure(e: BaseException) -> Optional[str]:
+    # transient: the site or the network was slow or flaky, retry soon.
+    # block: a challenge page or 403/429, slow down and retry after a pause.
+    # parse_drift: the page is there but not in the expected layout, a retry
+    # would not help (update selector_booking.py).
+    # None: any other error, not retried
+    if isinstance(e, BlockedError):
+        return "block"
+    if isinstance(e, FetchError):
+        # 404 and the like will not change on a retry
+        if e.status is not None and e.status < 500 and e.status != 408:
+            return None
+        return "transient"
+    if isinstance(e, NoSuchElementException):
+        return "parse_drift"
+    if isinstance(e, (TimeoutException, WebDriverException, ConnectionError,
+                      TimeoutError)):
+        return "transient"
+    if isinstance(e, (AttributeError, TypeError, ValueError, IndexError, KeyError)):
+        return "parse_drift"
+    return None
+
+
+class CrawlController:
+    # hotels in flight (limit) and spacing of hotel starts (interval), adjusted
+    # AIMD-style: additive increase on every fast success, multiplicative
+    # decrease on congestion (page latency far over the best seen, transient
+    # failures) and on blocks. blocks also double the spacing and pause every
+    # start for cooldown seconds. without adaptive, limit and interval stay
+    # fixed and failures are only classified and retried
+    def __init__(self,
+                 max_concurrency: int,
+                 adaptive: bool = False,
+                 max_retries: int = 2,
+                 cooldown: float = 60,
+                 backoff_base: float = 1,
+                 backoff_max: float = 60,
+                 latency_factor: float = 2,
+                 latency_slack: float = 0.1,
+                 decrease: float = 0.75,
+                 block_decrease: float = 0.5,
+                 interval_step: float = 0.1):
+        self.max_concurrency = max_concurrency
+        self.adaptive = adaptive
+        self.max_retries = max_retries
+        self.cooldown = cooldown
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.latency_factor = latency_factor
+        self.latency_slack = latency_slack  # seconds, jitter of fast pages
+        self.decrease = decrease
+        self.block_decrease = block_decrease
+        self.interval_step = interval_step
+        self.limit = float(max_concurrency)
+        self.interval = 0.0  # seconds between hotel starts
+        self.failure_counts = {kind: 0 for kind in failure_kinds}
+        self.retry_count = 0
+        self._in_flight = 0
+        self._next_start = 0.0
+        self._paused_until = 0.0
+        self._latency: Optional[float] = None  # moving average of page latency
+        self._best_latency: Optional[float] = None
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def _try_acquire(self) -> float:
+        # 0 if a hotel can start now, else the seconds to wait
+        now = time.monotonic()
+        with self._cond:
+            wait = max(self._paused_until, self._next_start) - now
+            if wait > 0:
+                return wait
+            if self._in_flight >= max(1, int(self.limit)):
+                return 0.05  # woken up by release in the sync path
+            self._in_flight += 1
+            self._next_start = now + self.interval
+            return 0
+
+    def acquire(self):
+        while True:
+            wait = self._try_acquire()
+            if not wait:
+                return
+            with self._cond:
+                self._cond.wait(wait)
+
+    async def acquire_async(self):
+        # no thread is held while waiting, threads of the event loop are
+        # needed by the hotels in flight
+        while True:
+            wait = self._try_acquire()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def release(self, kind: Optional[str] = None, latency: Optional[float] = None):
+        # end of a hotel attempt, kind is None on success.
+        # latency is the average seconds per page of the hotel
+        with self._cond:
+            self._in_flight -= 1
+            self.record_failure(kind)
+            if self.adaptive:
+                if kind == "block":
+                    self._paused_until = time.monotonic() + self.cooldown
+                    self.interval = min(self.backoff_max, max(1.0, self.interval * 2))
+                    self._decrease(self.block_decrease, force=True)
+                elif kind == "transient":
+                    self._decrease(self.decrease)
+                elif kind is None and latency is not None:
+                    self._observe_latency(latency)
+            self._cond.notify_all()
+
+    def record_failure(self, kind: Optional[str]):
+        # also for failures after the hotel left the controller (parsing)
+        if kind in self.failure_counts:
+            self.failure_counts[kind] += 1
+            metrics.inc(f"failures_{kind}")
+
+    def _observe_latency(self, latency: float):
+        self._latency = latency if self._latency is None else \
+            self._latency * 0.8 + latency * 0.2
+        self._best_latency = min(self._best_latency or self._latency, self._latency)
+        if self._latency > self._best_latency * self.latency_factor + self.latency_slack:
+            self._decrease(self.decrease)
+        else:
+            # + 1 hotel in flight per `limit` successes, like tcp congestion avoidance
+            self.limit = min(self.max_concurrency, self.limit + 1 / max(1, self.limit))
+            self.interval = max(0.0, self.interval - self.interval_step)
+
+    def _decrease(self, factor: float, force: bool = False):
+        # at most once per 10 page latencies, the hotels in flight started
+        # before the decrease report the same congestion
+        now = time.monotonic()
+        if not force and now - self._last_decrease < (self._latency or 0) * 10:
+            return
+        self._last_decrease = now
+        self.limit = max(1.0, self.limit * factor)
+        print(f"\nSlowing down: {int(self.limit)} hotels in flight, " +
+              f"{self.interval:.1f}s between hotels.")
+
+    def backoff(self, kind: str, attempt: int) -> float:
+        # exponential backoff with full jitter, blocks wait for the cooldown
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        return delay + (self.cooldown if kind == "block" else 0)
+
+    def _should_retry(self, e: Exception, attempt: int) -> Optional[float]:
+        # seconds to wait before the next attempt, None to give up
+        kind = classify_failure(e)
+        self.release(kind)
+        if kind not in retried_kinds or attempt >= self.max_retries:
+            return None
+        self.retry_count += 1
+        delay = self.backoff(kind, attempt)
+        print(f"\n{kind.capitalize()} failure. Retry {attempt+1}/{self.max_retries} " +
+              f"in {delay:.1f}s. Message:\n{e}")
+        return delay
+
+    def run(self, func: Callable, *args, pages: Optional[Callable] = None, **kwargs):
+        # func(*args, **kwargs) started under the limits, retried on transient
+        # failures and blocks. pages(result) is the page count for latency
+        for attempt in range(self.max_retries + 1):
+            self.acquire()
+            start_time = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                delay = self._should_retry(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            elapsed = time.perf_counter() - start_time
+            self.release(None, elapsed / max(1, pages(result) if pages else 1))
+            return result
+
+    async def run_async(self, func: Callable, *args, pages: Optional[Callable] = None,
+                        **kwargs):
+        # same as run, func is a coroutine function
+        for attempt in range(self.max_retries + 1):
+            await self.acquire_async()
+            start_time = time.perf_counter()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                delay = self._should_retry(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            elapsed = time.perf_counter() - start_time
+            self.release(None, elapsed / max(1, pages(result) if pages else 1))
+            return result
+
+    def print_summary(self):
+        print(f"Crawl controller: {self.retry_count} retries, failures " +
+              ", ".join(f"{kind} {count}" for kind, count in self.failure_counts.items()) +
+              (f", ended at {int(self.limit)} hotels in flight, " +
+               f"{self.interval:.1f}s between hotels." if self.adaptive else "."))
@@ -0,0 +1,148 @@
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Optional
+from parser_booking import HotelSnapshot
+
+
+class CrawlState:
+    # persistent state of crawls, keyed by the query parameters, so an
+    # interrupted crawl can be resumed with --resume
+    def __init__(self, path: str = "result/crawl_state.sqlite"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS queries (
+                query_key TEXT PRIMARY KEY,
+                query TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS hotels (
+                query_key TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                url TEXT NOT NULL,
+                done INTEGER NOT NULL DEFAULT 0,
+                last_page INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (query_key, idx)
+            );
+            CREATE TABLE IF NOT EXISTS pages (
+                query_key TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                page INTEGER NOT NULL,
+                html BLOB NOT NULL,
+                PRIMARY KEY (query_key, idx, page)
+            );
+            CREATE TABLE IF NOT EXISTS harvesting (
+                query_key TEXT PRIMARY KEY
+            );
+        ''')
+        self._conn.commit()
+
+    def _execute(self, sql: str, params: tuple = ()):
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            self._conn.commit()
+            return cursor.fetchall()
+
+    def get_urls(self, query_key: str, partial: bool = False) -> Optional[list[str]]:
+        # harvested urls_result of the query, None if never harvested
+        # or harvest interrupted. with partial, the urls harvested before
+        # the interruption (see is_harvesting)
+        if not self._execute('SELECT 1 FROM queries WHERE query_key = ?',
+                             (query_key,)):
+            return None
+        if self.is_harvesting(query_key) and not partial:
+            print("Harvest of search results was interrupted, harvest again.")
+            return None
+        rows = self._execute(
+            'SELECT url FROM hotels WHERE query_key = ? ORDER BY idx',
+            (query_key,))
+        return [row[0] for row in rows]
+
+    def is_harvesting(self, query_key: str) -> bool:
+        return bool(self._execute('SELECT 1 FROM harvesting WHERE query_key = ?',
+                                  (query_key,)))
+
+    def start(self, query_key: str, query: dict, urls: list[str],
+              harvested: bool = True):
+        # record a freshly harvested urls_result, forget any previous run.
+        # if not harvested, urls are streamed in by add_urls until finish_harvest
+        with self._lock:
+            self._conn.execute('DELETE FROM pages WHERE query_key = ?',
+                               (query_key,))
+            self._conn.execute('DELETE FROM hotels WHERE query_key = ?',
+                               (query_key,))
+            self._conn.execute(
+                'INSERT OR REPLACE INTO queries VALUES (?, ?, ?)',
+                (query_key, json.dumps(query, ensure_ascii=False), time.time()))
+            self._conn.executemany(
+                'INSERT INTO hotels (query_key, idx, url) VALUES (?, ?, ?)',
+                [(query_key, i, url) for i, url in enumerate(urls)])
+            self._conn.execute('DELETE FROM harvesting WHERE query_key = ?',
+                               (query_key,))
+            self._conn.execute(
+                'INSERT INTO harvesting SELECT ? WHERE ?',
+                (query_key, int(not harvested)))
+            self._conn.commit()
+
+    def add_urls(self, query_key: str, first_idx: int, urls: list[str]):
+        with self._lock:
+            self._conn.executemany(
+                'INSERT INTO hotels (query_key, idx, url) VALUES (?, ?, ?)',
+                [(query_key, first_idx + i, url) for i, url in enumerate(urls)])
+            self._conn.commit()
+
+    def finish_harvest(self, query_key: str):
+        self._execute('DELETE FROM harvesting WHERE query_key = ?', (query_key,))
+
+    def get_done(self, query_key: str) -> set[int]:
+        rows = self._execute(
+            'SELECT idx FROM hotels WHERE query_key = ? AND done = 1',
+            (query_key,))
+        return {row[0] for row in rows}
+
+    def save_page(self, query_key: str, idx: int, page: int, html: str):
+        # page 0 is the hotel page, 1..n are the review pages
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)',
+                (query_key, idx, page, zlib.compress(html.encode("utf8"))))
+            self._conn.execute(
+                'UPDATE hotels SET last_page = MAX(last_page, ?) ' +
+                'WHERE query_key = ? AND idx = ?',
+                (page, query_key, idx))
+            self._conn.commit()
+
+    def load_snapshot(self, query_key: str, idx: int, url: str) -> Optional[HotelSnapshot]:
+        # pages captured before the interruption, None if nothing captured
+        rows = self._execute(
+            'SELECT page, html FROM pages WHERE query_key = ? AND idx = ? ' +
+            'ORDER BY page',
+            (query_key, idx))
+        if not rows or rows[0][0] != 0:
+            return None
+
+        snapshot = HotelSnapshot(url)
+        snapshot.hotel_html = zlib.decompress(rows[0][1]).decode("utf8")
+        for page, html in rows[1:]:
+            if page != len(snapshot.review_pages) + 1:
+                break  # keep consecutive pages only
+            snapshot.review_pages.append(zlib.decompress(html).decode("utf8"))
+        return snapshot
+
+    def mark_done(self, query_key: str, idx: int):
+        with self._lock:
+            self._conn.execute(
+                'UPDATE hotels SET done = 1 WHERE query_key = ? AND idx = ?',
+                (query_key, idx))
+            self._conn.execute(
+                'DELETE FROM pages WHERE query_key = ? AND idx = ?',
+                (query_key, idx))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,5 +1,8 @@
-from typing import List, Optional
+from typing import Iterable, Iterator, List, Optional
+from urllib.parse import urlsplit, urlunsplit
+import hashlib
 import json
+import sys
 
 user_type_mapping = {
     "團體": "group",
@@ -19,7 +22,33 @@ subrating_mapping = {
 }
 
 
+review_fields = ("user_name", "user_type", "country", "room_name",
+                 "num_stay_night", "stay_date", "review_date", "title",
+                 "positive_description", "negative_description", "rating")
+
+# few distinct values shared by many reviews, kept once in memory
+categorical_review_fields = ("user_type", "country", "room_name", "stay_date")
+
+# fields identifying a review, a review crawled twice has the same values
+identity_review_fields = ("user_name", "review_date", "title",
+                          "positive_description", "negative_description", "rating")
+
+
+def intern_value(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def normalize_hotel_url(url: Optional[str]) -> Optional[str]:
+    # drop query (dates, guests, session ids...) and fragment of hotel url
+    if not url:
+        return url
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, "", ""))
+
+
 class Star:
+    __slots__ = ("count", "type")
+
     def __init__(self,
                  count: Optional[int] = None,
                  star_type: Optional[str] = None):
@@ -32,8 +61,15 @@ class Star:
             "type": self.type
         }
 
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(data.get("count"), data.get("type"))
+
 
 class OverallRating:
+    __slots__ = ("type", "average", "staff", "facilities", "cleanliness",
+                 "comfort", "value", "location", "wifi")
+
     def __init__(
         self,
         type: Optional[str] = None,
@@ -57,7 +93,7 @@ class OverallRating:
         self.wifi = wifi
 
     def update_subrating_by_keyword(self, key: str, value: float):
-        match subrating_mapping[key]:
+        match subrating_mapping.get(key):  # unknown subrating is ignored
             case 'staff':
                 self.staff = value
             case 'facilities':
@@ -86,8 +122,16 @@ class OverallRating:
             "wifi": self.wifi
         }
 
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(**{key: data.get(key) for key in [
+            "type", "average", "staff", "facilities", "cleanliness",
+            "comfort", "value", "location", "wifi"]})
+
 
 class Review:
+    __slots__ = review_fields
+
     def __init__(
         self,
         user_name: Optional[str] = None,
@@ -103,11 +147,11 @@ class Review:
         rating: Optional[float] = None  # 0.0~10.0
     ):
         self.user_name = user_name
-        self.user_type = user_type
-        self.country = country
-        self.room_name = room_name
+        self.user_type = intern_value(user_type)
+        self.country = intern_value(country)
+        self.room_name = intern_value(room_name)
         self.num_stay_night = num_stay_night
-        self.stay_date = stay_date
+        self.stay_date = intern_value(stay_date)
         self.review_date = review_date
         self.title = title
         self.positive_description = positive_description
@@ -129,8 +173,41 @@ class Review:
             "rating": self.rating
         }
 
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(**{key: data.get(key) for key in review_fields})
+
+    def content_hash(self) -> str:
+        # identity of a review, whitespace and missing fields normalized so
+        # the same review crawled twice (other page, other run) has same hash
+        values = list()
+        for field in identity_review_fields:
+            value = getattr(self, field)
+            if value is None:
+                value = ""
+            elif isinstance(value, float):
+                value = f"{value:.1f}"
+            values.append(" ".join(str(value).split()))
+        return hashlib.blake2b("\x1f".join(values).encode("utf8"),
+                               digest_size=16).hexdigest()
+
+
+def dedup_reviews(reviews: Iterable[Review],
+                  seen: Optional[set[str]] = None) -> list[Review]:
+    # reviews whose hash is not in seen yet, in order. seen is updated
+    seen = set() if seen is None else seen
+    unique = list()
+    for review in reviews:
+        review_hash = review.content_hash()
+        if review_hash not in seen:
+            seen.add(review_hash)
+            unique.append(review)
+    return unique
+
 
 class UserReview:
+    __slots__ = ("overall_rating", "count", "count_crawled", "reviews")
+
     def __init__(
         self,
         overall_rating: Optional[OverallRating] = None,
@@ -151,10 +228,22 @@ class UserReview:
             "reviews": [review.to_dict() for review in self.reviews]
         }
 
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(OverallRating.from_dict(data.get("overall_rating") or {}),
+                   data.get("count"),
+                   data.get("count_crawled"),
+                   [Review.from_dict(review)
+                    for review in data.get("reviews") or []])
+
 
 class BookingData:
+    __slots__ = ("url", "name", "address", "slogan", "description", "star",
+                 "user_review")
+
     def __init__(
         self,
+        url: Optional[str] = None,
         name: Optional[str] = None,
         address: Optional[str] = None,
         slogan: Optional[str] = None,
@@ -162,6 +251,7 @@ class BookingData:
         star: Optional[Star] = None,
         user_review: Optional[UserReview] = None
     ):
+        self.url = normalize_hotel_url(url)
         self.name = name
         self.address = address
         self.slogan = slogan
@@ -171,6 +261,7 @@ class BookingData:
 
     def to_dict(self):
         return {
+            "url": self.url,
             "name": self.name,
             "address": self.address,
             "slogan": self.slogan,
@@ -179,5 +270,48 @@ class BookingData:
             "user_review": self.user_review.to_dict()
         }
 
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(data.get("url"),
+                   data.get("name"),
+                   data.get("address"),
+                   data.get("slogan"),
+                   data.get("description"),
+                   Star.from_dict(data.get("star") or {}),
+                   UserReview.from_dict(data.get("user_review") or {}))
+
     def to_json(self):
         return json.dumps(self.to_dict(), indent=4)
+
+
+class ReviewColumns:
+    # column-wise buffer of reviews, one list per field instead of one object
+    # per review, categorical fields interned
+    __slots__ = ("columns",)
+
+    def __init__(self, reviews: Optional[list[Review]] = None):
+        self.columns = {field: [] for field in review_fields}
+        for review in reviews or []:
+            self.append(review)
+
+    def append(self, review: Review):
+        for field in review_fields:
+            self.columns[field].append(getattr(review, field))
+
+    def append_dict(self, review: dict):
+        for field in review_fields:
+            value = review.get(field)
+            if field in categorical_review_fields:
+                value = intern_value(value)
+            self.columns[field].append(value)
+
+    def clear(self):
+        for column in self.columns.values():
+            column.clear()
+
+    def __len__(self):
+        return len(self.columns["user_name"])
+
+    def __iter__(self) -> Iterator[Review]:
+        for values in zip(*(self.columns[field] for field in review_fields)):
+            yield Review(*values)
@@ -0,0 +1,157 @@
+import threading
+from contextlib import contextmanager
+from typing import Callable, Optional
+from selenium import webdriver
+from selenium.common.exceptions import (InvalidSessionIdException,
+                                        NoSuchWindowException,
+                                        TimeoutException,
+                                        WebDriverException)
+from selenium.webdriver.chrome.options import Options
+
+
+# url patterns (devtools protocol wildcards) of requests never sent by chrome
+image_patterns = ["*.png*", "*.jpg*", "*.jpeg*", "*.gif*", "*.webp*", "*.svg*",
+                  "*.ico*", "*.avif*"]
+font_patterns = ["*.woff*", "*.woff2*", "*.ttf*", "*.otf*", "*.eot*"]
+media_patterns = ["*.mp4*", "*.webm*", "*.mp3*"]
+tracker_patterns = ["*google-analytics.com*", "*googletagmanager.com*",
+                    "*doubleclick.net*", "*googlesyndication.com*",
+                    "*facebook.net*", "*connect.facebook.*", "*hotjar.*",
+                    "*clarity.ms*", "*bat.bing.com*", "*criteo.*",
+                    "*tiktok.com*", "*taboola.com*", "*outbrain.com*"]
+
+# presets of --block. "safe" keeps everything the selectors and the waits
+# need: html, scripts of booking.com (review sidebar, "下一頁", lazy load)
+# and css (clickability and scroll height). "aggressive" also drops css,
+# which is faster but may break clicks that depend on layout
+blocking_preset_mapping = {
+    "none": [],
+    "safe": image_patterns + font_patterns + media_patterns + tracker_patterns,
+    "aggressive": image_patterns + font_patterns + media_patterns +
+    tracker_patterns + ["*.css*"]
+}
+
+
+def create_chrome_driver(headless: bool = False,
+                         blocked_urls: Optional[list[str]] = None) -> webdriver.Chrome:
+    options = Options()
+    if headless:
+        options.add_argument('--headless=new')
+        options.add_argument('--window-size=1920,1080')  # no window to maximize
+    prefs = {"profile.default_content_settings.images": 2,
+             "profile.managed_default_content_settings.images": 2}
+    options.add_experimental_option('prefs', prefs)
+    driver = webdriver.Chrome(options=options)
+    if not headless:
+        driver.maximize_window()
+    if blocked_urls:
+        # blocked before any request is sent, for every page of the session
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": blocked_urls})
+    return driver
+
+
+def is_session_broken(e: BaseException) -> bool:
+    # element-level errors (no such element, stale element...) are subclasses
+    # of WebDriverException too, but leave the session usable
+    if isinstance(e, (InvalidSessionIdException,
+                      NoSuchWindowException,
+                      TimeoutException)):
+        return True
+    return type(e) is WebDriverException  # e.g. chrome not reachable
+
+
+class DriverPool:
+    def __init__(self,
+                 size: int = 1,
+                 driver_factory: Callable[[], webdriver.Chrome] = create_chrome_driver):
+        if size < 1:
+            raise ValueError("Driver pool size must be at least 1.")
+        self.size = size
+        self.driver_factory = driver_factory
+        self.recycled_count = 0
+        self._cond = threading.Condition()
+        self._idle: list[webdriver.Chrome] = []  # reuse the warmest session first
+        self._drivers: list[webdriver.Chrome] = []
+        self._pending = 0  # sessions being started
+        self._closed = False
+
+    def acquire(self) -> webdriver.Chrome:
+        # create sessions lazily until the pool is full, then wait for one
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Driver pool is closed.")
+                if self._idle:
+                    return self._idle.pop()
+                if len(self._drivers) + self._pending < self.size:
+                    self._pending += 1
+                    break
+                self._cond.wait()
+
+        try:
+            driver = self.driver_factory()
+        except BaseException:
+            with self._cond:
+                self._pending -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._pending -= 1
+            self._drivers.append(driver)
+        return driver
+
+    def release(self, driver: webdriver.Chrome, broken: bool = False):
+        with self._cond:
+            if not broken and not self._closed:
+                self._idle.append(driver)
+                self._cond.notify()
+                return
+            # drop the broken session so the next acquire starts a fresh one
+            if driver in self._drivers:
+                self._drivers.remove(driver)
+            if broken:
+                self.recycled_count += 1
+            self._cond.notify()
+        try:
+            driver.quit()
+        except Exception:
+            None
+
+    @contextmanager
+    def session(self):
+        driver = self.acquire()
+        try:
+            yield driver
+        except BaseException as e:
+            self.release(driver, broken=is_session_broken(e))
+            raise
+        else:
+            self.release(driver)
+
+    def run(self, func: Callable, *args, retries: int = 1, **kwargs):
+        # run func(driver, *args) on a pooled session, and retry on a
+        # fresh session if the browser itself broke down
+        last_error: Optional[Exception] = None
+        for _ in range(retries + 1):
+            try:
+                with self.session() as driver:
+                    return func(driver, *args, **kwargs)
+            except WebDriverException as e:
+                if not is_session_broken(e):
+                    raise
+                last_error = e
+                print(f"\nWebDriver session broken. Recycling. Message:\n{e}")
+        raise last_error
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            drivers, self._drivers = self._drivers, []
+            self._idle = []
+            self._cond.notify_all()
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                None
@@ -0,0 +1,167 @@
+import argparse
+import os
+from typing import Optional
+from data_model_booking import (ReviewColumns, categorical_review_fields,
+                                review_fields)
+from incremental import read_dataset
+
+export_suffix_mapping = {
+    "parquet": ".parquet",
+    "arrow": ".arrows"  # arrow ipc stream, each batch has its own dictionaries
+}
+
+hotel_columns = ["url", "name", "address", "slogan", "description",
+                 "star_count", "star_type", "rating_type", "rating_average",
+                 "staff", "facilities", "cleanliness", "comfort", "value",
+                 "location", "wifi", "review_count", "review_count_crawled"]
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError(
+            "Arrow/Parquet export requires the 'pyarrow' package. " +
+            "Install it with 'pip install pyarrow'.")
+    return pyarrow
+
+
+def _schemas(pa):
+    string, double, int64 = pa.string(), pa.float64(), pa.int64()
+    category = pa.dictionary(pa.int32(), pa.string())
+    hotel_types = [string] * 5 + [int64, string, string, double] + [double] * 7 + \
+        [int64, int64]
+    review_types = {"num_stay_night": int64, "rating": double}
+    hotel_schema = pa.schema(list(zip(hotel_columns, hotel_types)))
+    review_schema = pa.schema(
+        [("hotel_url", string), ("hotel_name", string)] +
+        [(field, category if field in categorical_review_fields
+          else review_types.get(field, string)) for field in review_fields])
+    return hotel_schema, review_schema
+
+
+def _hotel_row(record: dict) -> dict:
+    star = record.get("star") or {}
+    user_review = record.get("user_review") or {}
+    rating = user_review.get("overall_rating") or {}
+    return {
+        "url": record.get("url"),
+        "name": record.get("name"),
+        "address": record.get("address"),
+        "slogan": record.get("slogan"),
+        "description": record.get("description"),
+        "star_count": star.get("count"),
+        "star_type": star.get("type"),
+        "rating_type": rating.get("type"),
+        "rating_average": rating.get("average"),
+        "staff": rating.get("staff"),
+        "facilities": rating.get("facilities"),
+        "cleanliness": rating.get("cleanliness"),
+        "comfort": rating.get("comfort"),
+        "value": rating.get("value"),
+        "location": rating.get("location"),
+        "wifi": rating.get("wifi"),
+        "review_count": user_review.get("count"),
+        "review_count_crawled": user_review.get("count_crawled")
+    }
+
+
+class _TableWriter:
+    # batches of one table written to a .parquet or .arrows (ipc stream) file
+    def __init__(self, pa, path: str, schema, file_format: str):
+        self.pa = pa
+        self.schema = schema
+        if file_format == "parquet":
+            self._writer = pa.parquet.ParquetWriter(path, schema, compression="zstd")
+        else:
+            self._writer = pa.ipc.new_stream(path, schema)
+
+    def write(self, columns: dict):
+        arrays = list()
+        for field in self.schema:
+            values = columns[field.name]
+            if self.pa.types.is_dictionary(field.type):
+                arrays.append(self.pa.array(values, self.pa.string()).dictionary_encode())
+            else:
+                arrays.append(self.pa.array(values, field.type))
+        batch = self.pa.record_batch(arrays, schema=self.schema)
+        if isinstance(self._writer, self.pa.parquet.ParquetWriter):
+            self._writer.write_batch(batch)
+        else:
+            self._writer.write(batch)
+
+    def close(self):
+        self._writer.close()
+
+
+def export_dataset(input_path: str,
+                   output_dir: Optional[str] = None,
+                   file_format: str = "parquet",
+                   batch_size: int = 50000) -> tuple[str, str]:
+    # stream a result (.json, .jsonl, .jsonl.gz or .jsonl.zst) into a hotels
+    # table and a reviews table, only one batch of reviews is held in memory
+    pa = _import_pyarrow()
+    if file_format not in export_suffix_mapping:
+        raise ValueError(f"Unknown export format '{file_format}'.")
+
+    name = os.path.basename(input_path).split(".json")[0]
+    output_dir = output_dir or os.path.dirname(input_path)
+    suffix = export_suffix_mapping[file_format]
+    hotels_path = os.path.join(output_dir, f"{name}_hotels{suffix}")
+    reviews_path = os.path.join(output_dir, f"{name}_reviews{suffix}")
+
+    hotel_schema, review_schema = _schemas(pa)
+    hotel_writer = _TableWriter(pa, hotels_path, hotel_schema, file_format)
+    review_writer = _TableWriter(pa, reviews_path, review_schema, file_format)
+
+    hotels = {column: [] for column in hotel_columns}
+    reviews = ReviewColumns()
+    review_hotels = {"hotel_url": [], "hotel_name": []}
+    hotel_count = review_count = 0
+
+    def flush_reviews():
+        if len(reviews):
+            review_writer.write({**review_hotels, **reviews.columns})
+        reviews.clear()
+        for column in review_hotels.values():
+            column.clear()
+
+    try:
+        for record in read_dataset(input_path):
+            for column, value in _hotel_row(record).items():
+                hotels[column].append(value)
+            hotel_count += 1
+            for review in (record.get("user_review") or {}).get("reviews") or []:
+                reviews.append_dict(review)
+                review_hotels["hotel_url"].append(record.get("url"))
+                review_hotels["hotel_name"].append(record.get("name"))
+                review_count += 1
+                if len(reviews) >= batch_size:
+                    flush_reviews()
+        flush_reviews()
+        hotel_writer.write(hotels)
+    finally:
+        hotel_writer.close()
+        review_writer.close()
+
+    print(f"{hotel_count} hotels exported to '{hotels_path}', " +
+          f"{review_count} reviews exported to '{reviews_path}'.")
+    return hotels_path, reviews_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export a result into hotels and reviews tables (Parquet or Arrow).")
+    parser.add_argument("input", type=str,
+                        help="Path of .json, .jsonl, .jsonl.gz or .jsonl.zst result.")
+    parser.add_argument("-fmt", "--format", type=str, choices=["parquet", "arrow"],
+                        help="Format of the tables.", default="parquet")
+    parser.add_argument("-o", "--output_dir", type=str,
+                        help="Directory of the tables. Default: same as input.")
+    parser.add_argument("-bs", "--batch_size", type=int,
+                        help="Number of reviews per written batch.", default=50000)
+    args = parser.parse_args()
+
+    export_dataset(args.input, args.output_dir, args.format, args.batch_size)
@@ -0,0 +1,160 @@
+import threading
+import time
+from typing import Callable, Optional
+from urllib.parse import urlencode, urlsplit, urlunsplit
+import urllib3
+from metrics import metrics
+from parser_booking import HotelSnapshot, has_booking_reviews
+from selector_booking import block_page_markers, selector_mapping
+
+default_headers = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) " +
+                  "AppleWebKit/537.36 (KHTML, like Gecko) " +
+                  "Chrome/131.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "zh-TW,zh;q=0.9,en;q=0.8"
+}
+
+
+class FetchError(Exception):
+    def __init__(self, url: str, status: Optional[int] = None, message: str = ""):
+        self.url = url
+        self.status = status
+        super().__init__(message or f"HTTP {status} from '{url}'.")
+
+
+class ContentMissingError(FetchError):
+    # page fetched but the content we extract is not server-rendered,
+    # the page should be crawled by browser instead
+    pass
+
+
+class BlockedError(FetchError):
+    # a challenge (captcha) page served instead of the content
+    pass
+
+
+class HttpFetcher:
+    # keep-alive connection pool shared by all crawling threads
+    def __init__(self,
+                 max_connections: int = 10,
+                 timeout: float = 10,
+                 retries: int = 2,
+                 headers: Optional[dict] = None):
+        self._pool = urllib3.PoolManager(
+            num_pools=4,
+            maxsize=max_connections,
+            block=True,
+            headers=headers or default_headers,
+            timeout=urllib3.Timeout(total=timeout),
+            # 429 is not retried here, it is a block for the crawl controller
+            retries=urllib3.Retry(total=retries,
+                                  backoff_factor=0.5,
+                                  status_forcelist=[500, 502, 503, 504]))
+        self.request_count = 0
+        self.total_time = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> str:
+        start_time = time.perf_counter()
+        try:
+            response = self._pool.request("GET", url)
+        except urllib3.exceptions.HTTPError as e:
+            metrics.inc("fetch_errors")
+            raise FetchError(url, message=f"Cannot fetch '{url}'. {e}")
+        finally:
+            elapsed = time.perf_counter() - start_time
+            metrics.observe("fetch.http", elapsed)
+            with self._lock:
+                self.request_count += 1
+                self.total_time += elapsed
+        if response.status in (403, 429):
+            metrics.inc("fetch_errors")
+            raise BlockedError(url, response.status)
+        if response.status != 200:
+            metrics.inc("fetch_errors")
+            raise FetchError(url, response.status)
+        return response.data.decode("utf8", errors="replace")
+
+    def print_summary(self):
+        if self.request_count:
+            print(f"HTTP fetch: {self.request_count} requests, " +
+                  f"avg {round(self.total_time / self.request_count * 1000)}ms.")
+
+    def close(self):
+        self._pool.clear()
+
+
+def review_page_url(hotel_url: str, page: int, rows: int = 10) -> str:
+    # "/hotel/jp/hotel-name.zh-tw.html" -> review list of "hotel-name" in "jp",
+    # newest reviews first
+    parts = urlsplit(hotel_url)
+    path_items = parts.path.strip("/").split("/")
+    query = {
+        "pagename": path_items[-1].split(".")[0],
+        "cc1": path_items[-2] if len(path_items) >= 2 else "",
+        "type": "total",
+        "sort": "f_recent_desc",
+        "rows": rows,
+        "offset": (page - 1) * rows
+    }
+    return urlunsplit((parts.scheme, parts.netloc,
+                       "/reviewlist.zh-tw.html", urlencode(query), ""))
+
+
+def check_blocked(url: str, html: str, selector_name: str):
+    # the expected element is missing and the page looks like a challenge
+    if selector_mapping[selector_name].marker not in html and \
+            any(marker in html for marker in block_page_markers):
+        metrics.inc("block_pages")
+        raise BlockedError(url, message=f"Challenge page instead of '{url}'.")
+
+
+def check_hotel_page(url: str, html: str):
+    check_blocked(url, html, "hotel_name")
+    if selector_mapping["hotel_name"].marker not in html:
+        raise ContentMissingError(url, message="Hotel header is missing.")
+
+
+def check_review_page(url: str, html: str) -> bool:
+    # return False if the page has no more review
+    check_blocked(url, html, "review_list")
+    if selector_mapping["review_list"].marker not in html:
+        raise ContentMissingError(url, message="Review list is missing.")
+    return selector_mapping["review_card"].marker in html
+
+
+def get_snapshot_over_http(fetcher: HttpFetcher,
+                           url: str,
+                           max_page: int,
+                           snapshot: Optional[HotelSnapshot] = None,
+                           on_page: Optional[Callable[[int, str], None]] = None,
+                           stop_page: Optional[Callable[[str], bool]] = None):
+    # same as get_snapshot_from_hotel_page, without a browser.
+    # raise ContentMissingError if the pages do not hold the content to extract
+    snapshot = snapshot or HotelSnapshot(url)
+    on_page = on_page or (lambda page, html: None)
+    if len(snapshot.review_pages) >= max_page:
+        return snapshot
+
+    if not snapshot.hotel_html:
+        hotel_html = fetcher.get(url)
+        check_hotel_page(url, hotel_html)
+        snapshot.hotel_html = hotel_html
+        on_page(0, snapshot.hotel_html)
+
+    if not has_booking_reviews(snapshot.hotel_html):
+        return snapshot
+
+    page_count = len(snapshot.review_pages)
+    while page_count < max_page:
+        if page_count and stop_page and stop_page(snapshot.review_pages[-1]):
+            break
+        page_url = review_page_url(url, page_count + 1)
+        html = fetcher.get(page_url)
+        if not check_review_page(page_url, html):
+            break  # no more review
+        snapshot.review_pages.append(html)
+        page_count += 1
+        on_page(page_count, html)
+    return snapshot
@@ -0,0 +1,85 @@
+import json
+import zlib
+from typing import Iterator, Optional
+from data_model_booking import (BookingData, Review, dedup_reviews,
+                                normalize_hotel_url)
+from output_writer import read_jsonl
+from parser_booking import parse_review_page
+
+
+def read_dataset(path: str) -> Iterator[dict]:
+    # records of a previous result, either pretty .json or .jsonl(.gz/.zst)
+    if path.endswith(".json"):
+        with open(path, "r", encoding='utf8') as file:
+            yield from json.load(file)
+    else:
+        yield from read_jsonl(path)
+
+
+class HotelIndex:
+    def __init__(self, newest_review_date: Optional[str], review_hashes: set[str]):
+        self.newest_review_date = newest_review_date  # yyyy-MM-dd
+        self.review_hashes = review_hashes  # Review.content_hash()
+
+
+class IncrementalIndex:
+    # index of a previous dataset per hotel url, used to crawl only the
+    # reviews newer than the previous run and merge them into the old record
+    def __init__(self, path: str):
+        self.path = path
+        self.hotels: dict[str, HotelIndex] = {}
+        self._records: dict[str, bytes] = {}  # compressed previous records
+        self._merged: set[str] = set()
+        for record in read_dataset(path):
+            url = normalize_hotel_url(record.get("url"))
+            if not url:
+                continue  # records before hotel url was saved cannot be matched
+            reviews = [Review.from_dict(review)
+                       for review in (record.get("user_review") or {}).get("reviews") or []]
+            review_dates = [review.review_date for review in reviews
+                            if review.review_date]
+            self.hotels[url] = HotelIndex(max(review_dates, default=None),
+                                          {review.content_hash() for review in reviews})
+            self._records[url] = zlib.compress(
+                json.dumps(record, ensure_ascii=False).encode("utf8"))
+        print(f"Incremental mode. {len(self.hotels)} hotels indexed from '{path}'.")
+
+    def get(self, url: str) -> Optional[HotelIndex]:
+        return self.hotels.get(normalize_hotel_url(url))
+
+    def reached_known_reviews(self, url: str, html: str) -> bool:
+        # reviews are sorted newest-first, so stop paginating at the first
+        # page holding a review we already have
+        hotel = self.get(url)
+        if not hotel:
+            return False
+        for review in parse_review_page(html):
+            if review.content_hash() in hotel.review_hashes:
+                return True
+            if hotel.newest_review_date and review.review_date and \
+                    review.review_date < hotel.newest_review_date:
+                return True
+        return False
+
+    def merge(self, data: BookingData) -> BookingData:
+        # put new reviews in front of the reviews of the previous record
+        record = self._records.get(data.url)
+        if record is None:
+            return data
+        self._merged.add(data.url)
+        previous = BookingData.from_dict(
+            json.loads(zlib.decompress(record).decode("utf8")))
+
+        hotel = self.hotels[data.url]
+        new_reviews = dedup_reviews(data.user_review.reviews, hotel.review_hashes)
+        # duplicates already saved by older runs are dropped as well
+        data.user_review.reviews = new_reviews + \
+            dedup_reviews(previous.user_review.reviews)
+        print(f"{data.name}: {len(new_reviews)} new reviews merged.")
+        return data
+
+    def remaining(self) -> Iterator[dict]:
+        # previous records of hotels not crawled in this run, kept as they are
+        for url, record in self._records.items():
+            if url not in self._merged:
+                yield json.loads(zlib.decompress(record).decode("utf8"))
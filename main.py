@@ -1,293 +1,341 @@
 import argparse
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
 from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from bs4 import BeautifulSoup
 import time
 from datetime import datetime, timedelta
-import json
-import re
+from functools import partial
+from typing import Callable, Iterator, Optional, Union
 from tqdm import tqdm
-from data_model_booking import BookingData, Review, user_type_mapping
-
-
-def get_data_from_hotel_page(driver: webdriver.Chrome, url: str, max_page: int):
-    data = BookingData()
-    driver.get(url)
-    time.sleep(5)
-
-    soup = BeautifulSoup(driver.page_source, 'html.parser')
-
-    # basic infos
-    data.name = soup.find('h2', class_="pp-header__title").getText(strip=True)
-    print(data.name)
-    data.address = soup.find(
-        'div', class_="a53cbfa6de f17adf7576").contents[0].getText(strip=True)
-
-    slogan_div = soup.find('h3', class_="e1eebb6a1e b484330d89")
-    data.slogan = slogan_div.getText() if slogan_div else None
-
-    data.description = soup.find(
-        'p', class_="a53cbfa6de b3efd73f69").getText(strip=True)
-
-    # stars
-    star_div = soup.find('span', class_="hp__hotel_ratings")
-    data.star.count = len(star_div.find_all(
-        'span', class_="fcd9eec8fb d31eda6efc c25361c37f"))
-    if data.star.count > 0:
-        star_text = star_div.find(
-            'span', class_="a455730030 d542f184f1").get("data-testid")
-        data.star.type = "official" if star_text == "rating-stars" else "booking"
-
-    # ratings
-    # get overall average rating
-    average_rating_div = soup.find('div', id="js--hp-gallery-scorecard")
-    if not average_rating_div:
-        # if there is no review then skip
-        data.user_review.overall_rating.type = None
-        print("No review.")
-        return data
-
+from async_engine import AsyncCrawlEngine
+from crawl_controller import CrawlController, classify_failure, retried_kinds
+from crawl_state import CrawlState
+from driver_pool import DriverPool, blocking_preset_mapping, create_chrome_driver
+from http_fetcher import (BlockedError, FetchError, HttpFetcher, check_blocked,
+                          get_snapshot_over_http)
+from incremental import IncrementalIndex, read_dataset
+from export_arrow import export_dataset
+from output_writer import (HotelRecordSpool, JsonlWriter, OrderedRecordWriter,
+                           compact_jsonl, compression_suffix_mapping,
+                           write_query_refs)
+from metrics import metrics
+from page_cache import PageCache
+from parse_pipeline import ParsePipeline
+from review_index import ReviewIndex
+from work_queue import QueueWorker, QueuedRecord, WorkQueue
+from search_harvester import (extract_result_links, get_result_links_over_http,
+                              is_result_page, iter_search_results)
+from data_model_booking import (BookingData, Review, dedup_reviews,
+                                normalize_hotel_url)
+from parser_booking import (HotelSnapshot, make_soup, parse_hotel_page,
+                            parse_review_page, parse_snapshot,
+                            set_parser_backend)
+from selector_booking import review_card_css, selector_mapping
+from wait_engine import (WaitEngine, element_present, page_height_changed,
+                         element_count_increased, first_element_text,
+                         first_element_text_changed)
+
+
+def get_review_list_html(driver: webdriver.Chrome) -> str:
+    # only the review list crosses the webdriver wire, not the hotel page
+    # behind the review sidebar. whole page if the list is not found
+    html = driver.execute_script(
+        "const list = document.querySelector(arguments[0]);" +
+        "return list ? list.outerHTML : null;",
+        selector_mapping["review_list"].css)
+    return html or driver.page_source
+
+
+def iter_hotel_pages(driver: webdriver.Chrome,
+                     url: str,
+                     max_page: int,
+                     waits: Optional[WaitEngine] = None,
+                     snapshot: Optional[HotelSnapshot] = None,
+                     stop_page: Optional[Callable[[str], bool]] = None
+                     ) -> Iterator[tuple[int, str]]:
+    # drive the browser and yield (page, html) of every newly captured page,
+    # page 0 is the hotel page, 1..n are the review pages.
+    # pages already in snapshot (from a resumed crawl or the http fetch) are
+    # not captured again. reviews are sorted newest-first, the order of the
+    # http review list, so captured pages are continued in the same order.
+    # with stop_page, pagination stops after the first page for which
+    # stop_page(html) is true
+    waits = waits or WaitEngine()
+    snapshot = snapshot or HotelSnapshot(url)
+    if len(snapshot.review_pages) >= max_page:
+        return
+
+    with metrics.timer("browser.hotel_navigate"):
+        driver.get(url)
+        header_loaded = waits.until(driver, "hotel_header", element_present(
+            selector_mapping["hotel_name"].css))
+    if not snapshot.hotel_html:
+        with metrics.timer("browser.snapshot"):
+            hotel_html = driver.page_source
+        check_blocked(url, hotel_html, "hotel_name")
+        if not header_loaded:
+            # a slow page, not a broken session: retried by the controller
+            # on the same session
+            raise FetchError(url, message=f"Hotel header of '{url}' did not load.")
+        yield 0, hotel_html
+
+    # skip review pages if there is no review or review data is from external
+    average_rating_divs = driver.find_elements(
+        By.CSS_SELECTOR, selector_mapping["scorecard"].css)
+    if not average_rating_divs:
+        return
+    average_rating = average_rating_divs[0].get_attribute("data-review-score")
     try:
-        # get average rating
-        data.user_review.overall_rating.average = (float)(
-            average_rating_div.attrs.get("data-review-score", 0))
-        data.user_review.overall_rating.type = "booking"
-    except:
-        # get external average rating
-        external_average_rating_div = average_rating_div.find('div',
-                                                              class_="a3b8729ab1 e6208ee469 cb2cbb3ccb")
-        external_average_rating_match = re.search(r'\d+(\.\d+)?$',
-                                                  external_average_rating_div.text)
-        data.user_review.overall_rating.average = float(
-            external_average_rating_match.group())
-        data.user_review.overall_rating.type = "external"
-        print("Review data is from external.")
-        return data
-
-    # get subrating
-    subrating_divs = soup.find_all(
-        'div', class_="c624d7469d f034cf5568 c69ad9b0c2 b57676889b c6198b324c a3214e5942")
-    for subrating_div in subrating_divs[int(len(subrating_divs)/2):]:
-        key = subrating_div.find('span',
-                                 class_="be887614c2").getText(strip=True)
-        value = float(subrating_div.find('div',
-                                         class_="ccb65902b2 bdc1ea4a28").getText(strip=True))
-        data.user_review.overall_rating.update_subrating_by_keyword(key,
-                                                                    value)
-
-    # get total count of reviews
-    review_count_div = soup.find(
-        'div', class_="abf093bdfe f45d8e4c32 d935416c47")
-    review_count_origin = review_count_div.text
-    data.user_review.count = int(
-        re.search(r'(\d[\d,]*)', review_count_origin).group(1).replace(',', ''))
+        float(0 if average_rating is None else average_rating)
+    except ValueError:
+        return
 
     # click review button
-    review_button = driver.find_element(
-        By.ID, "reviews-tab-trigger")
-    review_button.click()
-    time.sleep(3)
-
-    # reparse and get review sidebar
+    with metrics.timer("browser.review_tab"):
+        review_button = driver.find_element(
+            By.CSS_SELECTOR, selector_mapping["reviews_tab"].css)
+        review_button.click()
+        waits.until(driver, "review_list", element_present(review_card_css))
+    if not sort_reviews_newest_first(driver, waits):
+        stop_page = None  # not safe to stop early in unknown order
+        if snapshot.review_pages:  # captured newest-first, cannot continue them
+            print(f"\nCapture review pages of '{url}' again.")
+            snapshot.review_pages = []
+
+    # capture review sidebar of every page
     page_count = 1
-    with tqdm(total=data.user_review.count) as pbar:
+    captured_count = len(snapshot.review_pages)
+    with tqdm(unit="page") as pbar:
         while True:
-            pbar.set_description(f"Getting review page {page_count}")
-            soup = BeautifulSoup(driver.page_source, 'html.parser')
-            review_section = soup.find('div', class_="b89e77822a")
-            current_review_divs = review_section.find_all(
-                'div', class_="d799cd346c")
-            for review_div in current_review_divs:
-                try:
-                    review = Review()
-
-                    review.user_name = review_div.find(
-                        'div', class_="a3332d346a e6208ee469").getText(strip=True)
-
-                    country_div = review_div.find(
-                        'span', class_="afac1f68d9 a1ad95c055")
-                    review.country = country_div.getText(
-                        strip=True) if country_div else None
-
-                    review.room_name = review_div.find(
-                        'span', {"data-testid": "review-room-name"}).getText(strip=True)
-
-                    # transform "n 晚" to "n"(int)
-                    num_stay_night_div = review_div.find(
-                        'span', {"data-testid": "review-num-nights"})
-                    review.num_stay_night = int(num_stay_night_div.getText(
-                        separator=" ", strip=True)[0])
-
-                    # transform "yyyy 年 MM 月" to "yyyy-MM"
-                    stay_date_origin = review_div.find(
-                        'span', class_="abf093bdfe d88f1120c1").text
-                    stay_date_matched = re.search(
-                        r'(\d{4}) 年 (\d{1,2}) 月', stay_date_origin)
-                    review.stay_date = \
-                        f"{stay_date_matched.group(1)}-" + \
-                        f"{stay_date_matched.group(2).zfill(2)}"
-
-                    user_type_div = review_div.find(
-                        'span', {"data-testid": "review-traveler-type"})
-                    review.user_type = \
-                        user_type_mapping[f"{user_type_div.text}"] \
-                        if user_type_div else None
-
-                    # transform "yyyy 年 MM 月 dd 日" to "yyyy-MM-dd"
-                    review_date_origin = review_div.find(
-                        'span', class_="abf093bdfe f45d8e4c32").text
-                    review_date_matched = re.search(
-                        r'(\d{4}) 年 (\d{1,2}) 月 (\d{1,2}) 日', review_date_origin)
-                    review.review_date = \
-                        f"{review_date_matched.group(1)}" +\
-                        f"-{review_date_matched.group(2).zfill(2)}" +\
-                        f"-{review_date_matched.group(3).zfill(2)}"
-
-                    title_div = review_div.find(
-                        'h3', {"data-testid": "review-title"})
-                    review.title = title_div.text if title_div else None
-
-                    positive_description_div = review_div.find(
-                        'div', {"data-testid": "review-positive-text"})
-                    review.positive_description = positive_description_div.getText(
-                        strip=True) if positive_description_div else None
-
-                    negative_description_div = review_div.find(
-                        'div', {"data-testid": "review-negative-text"})
-                    review.negative_description = negative_description_div.getText(
-                        strip=True) if negative_description_div else None
-
-                    rating_div = review_div.find(
-                        'div', {"data-testid": "review-score"})
-                    review.rating = \
-                        float(rating_div.getText(strip=True).split('分')[-1])\
-                        if rating_div else None
-
-                    data.user_review.reviews.append(review)
-                except Exception as e:
-                    print(f"Error when getting an review. Skip and continue. Message:\n{e}")
-                    continue
-            pbar.update(len(current_review_divs))
+            if page_count > captured_count:
+                pbar.set_description(f"Getting review page {page_count}")
+                with metrics.timer("browser.snapshot"):
+                    html = get_review_list_html(driver)
+                check_blocked(url, html, "review_list")
+                yield page_count, html
+            else:
+                pbar.set_description(f"Skipping captured review page {page_count}")
+                html = snapshot.review_pages[page_count-1]
+            pbar.update(1)
 
             if page_count >= max_page:  # page limiter
                 pbar.set_description(
                     f"Getting review page {page_count} [max page reached]")
-                return data
+                return
+
+            if stop_page and stop_page(html):
+                pbar.set_description(
+                    f"Getting review page {page_count} [known reviews reached]")
+                return
 
             # click and change to next page
             try:  # check if next button exist
                 next_page_button = driver.find_element(
-                    By.XPATH, '//button[@aria-label="下一頁"]')
+                    By.CSS_SELECTOR, selector_mapping["next_page_button"].css)
                 if next_page_button.is_enabled():  # click if clickable(no disable attr)
-                    next_page_button.click()
-                    page_count += 1
-                    time.sleep(2)
+                    with metrics.timer("browser.page_turn"):
+                        first_review_text = first_element_text(
+                            driver, review_card_css)
+                        next_page_button.click()
+                        page_count += 1
+                        waits.until(driver, "review_page", first_element_text_changed(
+                            review_card_css, first_review_text))
                 else:
-                    return data
+                    return
             except:
-                return data
-
-    return data
-
-
-def booking_web_crawler(args):
-    start_time = time.time()
-
-    query = {
-        "search": args.search,
-        "check_in": args.check_in,
-        "check_out": args.check_out,
-        "num_adults": args.num_adults,
-        "num_children": args.num_children,
-        "num_rooms": args.num_rooms
-    }
-
-    # Set up Selenium WebDriver
-    options = Options()
-    # options.add_argument('--headless=new')
-    prefs = {"profile.default_content_settings.images": 2,
-             "profile.managed_default_content_settings.images": 2}
-    options.add_experimental_option('prefs', prefs)
-    driver = webdriver.Chrome(options=options)
-    driver.maximize_window()
-
-    # build up query url
-    url_query = "https://www.booking.com/searchresults.zh-tw.html"
-    url_query += f"?ss={query['search']}"
-    if query["check_in"]:
-        url_query += f"&checkin={query['check_in']}"
-    if query["check_out"]:
-        url_query += f"&checkout={query['check_out']}"
-    url_query += f"&group_adults={query['num_adults']}"
-    url_query += f"&no_room={query['num_rooms']}"
-    url_query += f"&group_children={query['num_children']}"
-    print(f"Query URL: '{url_query}'")
-    print(f"Max web-crawling items: {args.max_item}. " +
-          f"Max review page: {args.max_page}")
-
-    driver.get(url_query)
-    time.sleep(5)  # Wait for results to load
+                return
+
+
+def get_snapshot_from_hotel_page(driver: webdriver.Chrome,
+                                 url: str,
+                                 max_page: int,
+                                 waits: Optional[WaitEngine] = None,
+                                 snapshot: Optional[HotelSnapshot] = None,
+                                 on_page: Optional[Callable[[int, str], None]] = None,
+                                 stop_page: Optional[Callable[[str], bool]] = None):
+    # only capture raw pages, parsing is done by parse_snapshot (in the
+    # parse pipeline). every newly captured page is passed to on_page(page, html)
+    snapshot = snapshot or HotelSnapshot(url)
+    on_page = on_page or (lambda page, html: None)
+    for page, html in iter_hotel_pages(driver, url, max_page, waits,
+                                       snapshot, stop_page):
+        if page == 0:
+            snapshot.hotel_html = html
+        else:
+            snapshot.review_pages.append(html)
+        on_page(page, html)
+    return snapshot
+
+
+def iter_hotel_reviews(driver: webdriver.Chrome,
+                       url: str,
+                       max_page: int,
+                       waits: Optional[WaitEngine] = None
+                       ) -> Iterator[Union[BookingData, list[Review]]]:
+    # streaming version of get_data_from_hotel_page: yield the hotel header
+    # (BookingData without reviews, with OverallRating) first, then the
+    # reviews of every page as soon as the page is captured, so only one
+    # page is held in memory whatever the number of reviews
+    seen = set()
+    for page, html in iter_hotel_pages(driver, url, max_page, waits):
+        if page == 0:
+            with metrics.timer("parse.hotel_page"):
+                data = parse_hotel_page(html)
+            data.url = normalize_hotel_url(url)
+            yield data
+            if data.user_review.overall_rating.type != "booking":
+                return
+        else:
+            with metrics.timer("parse.review_page"):
+                reviews = parse_review_page(html)
+            yield dedup_reviews(reviews, seen)
+
+
+def sort_reviews_newest_first(driver: webdriver.Chrome,
+                              waits: Optional[WaitEngine] = None):
+    waits = waits or WaitEngine()
+    try:
+        first_review_text = first_element_text(
+            driver, review_card_css)
+        driver.find_element(
+            By.CSS_SELECTOR, selector_mapping["review_sort_trigger"].css).click()
+        driver.find_element(
+            By.CSS_SELECTOR, selector_mapping["review_sort_newest"].css).click()
+        waits.until(driver, "review_page", first_element_text_changed(
+            review_card_css, first_review_text))
+        return True
+    except Exception as e:
+        print(f"\nCannot sort reviews by newest. Message:\n{e}")
+        return False
+
+
+def get_data_from_hotel_page(driver: webdriver.Chrome,
+                             url: str,
+                             max_page: int,
+                             waits: Optional[WaitEngine] = None):
+    return parse_snapshot(get_snapshot_from_hotel_page(driver,
+                                                       url,
+                                                       max_page,
+                                                       waits))
+
+
+def get_urls_from_search_page(driver: webdriver.Chrome,
+                              url_query: str,
+                              waits: Optional[WaitEngine] = None):
+    waits = waits or WaitEngine()
+    with metrics.timer("browser.search_load"):
+        driver.get(url_query)
+        waits.until(driver, "search_results",  # Wait for results to load
+                    element_present(selector_mapping["search_result_link"].css))
 
     # close first visit dialog
     try:
-        driver.find_element(By.CLASS_NAME,
-                            "a83ed08757.c21c56c305.f38b6daa18.d691166b09.ab98298258.f4552b6561").click()
+        driver.find_element(By.CSS_SELECTOR,
+                            selector_mapping["first_visit_dialog_close"].css).click()
     except:
         None
 
     # scroll for lazy load
     print("Scrolling for lazy load...")
-    current_height = driver.execute_script(
-        'window.scrollTo(0,document.body.scrollHeight);')
     while True:
-        driver.execute_script('window.scrollTo(0,document.body.scrollHeight);')
-        time.sleep(3)
-        new_height = driver.execute_script('return document.body.scrollHeight')
-        if new_height == current_height:
+        with metrics.timer("browser.search_scroll"):
+            current_height = driver.execute_script(
+                'window.scrollTo(0,document.body.scrollHeight);' +
+                'return document.body.scrollHeight')
+            changed = waits.settle(driver, "scroll",
+                                   page_height_changed(current_height))
+        if not changed:
             break
-        current_height = new_height
     # click load more after lazy load stop
     while True:
         try:
             load_more_button = driver.find_element(
-                By.CLASS_NAME, "a83ed08757.c21c56c305.bf0537ecb5.f671049264.af7297d90d.c0e0affd09")
+                By.CSS_SELECTOR, selector_mapping["load_more_button"].css)
             driver.execute_script(
                 "arguments[0].scrollIntoView(false);", load_more_button)
             WebDriverWait(driver, 3).until(
-                EC.element_to_be_clickable(load_more_button)).click()
-            time.sleep(3)
+                EC.element_to_be_clickable(load_more_button))
+            current_count = len(driver.find_elements(
+                By.CSS_SELECTOR, selector_mapping["search_result_link"].css))
+            with metrics.timer("browser.search_load_more"):
+                load_more_button.click()
+                waits.settle(driver, "load_more", element_count_increased(
+                    selector_mapping["search_result_link"].css, current_count))
         except:
             break
 
     # get all result url
-    soup = BeautifulSoup(driver.page_source, 'html.parser')
+    soup = make_soup(driver.page_source, "search_result_link")
     urls_result = list(map(lambda item: item.get("href"),
-                           soup.find_all('a', class_="a78ca197d0")))
+                           selector_mapping["search_result_link"].find_all(soup)))
 
-    # start web-crawling for every url
-    dataset = list()
-    for i, url in enumerate(urls_result):
-        print(f"Web-crawling item {i+1}/{len(urls_result)}...", end='')
+    return urls_result
 
+
+query_fields = ["search", "check_in", "check_out",
+                "num_adults", "num_children", "num_rooms"]
+
+
+def check_dates(check_in: Optional[str], check_out: Optional[str]):
+    # check-in and check-out date checker
+    if check_in or check_out:
+        if not (check_in and check_out):
+            raise ValueError(
+                "Check-in and check-out date must be used at same time.")
+
+        current_date = datetime.now().date()
         try:
-            data = get_data_from_hotel_page(driver,
-                                            url,
-                                            args.max_page)
-            dataset.append(data.to_dict())
-        except KeyboardInterrupt:
-            print("\nStop by user. Saving data at current position.")
-            break
-        except Exception as e:
-            print(f"\nError when web-crawling. Skip. Message:\n{e}")
+            check_in_date = datetime.strptime(check_in, "%Y-%m-%d").date()
+            check_out_date = datetime.strptime(
+                check_out, "%Y-%m-%d").date()
+        except:
+            raise ValueError(
+                "Invalid date format for check-in or check-out date. should be \"yyyy-MM-dd\"")
 
-        if (i+1) >= args.max_item:  # item count limiter
-            print("Max item reached. Saving data at current position.")
-            break
+        if check_in_date < current_date or check_out_date < current_date:
+            raise ValueError(
+                "Check-in or check-out date cannot be an past date.")
+        if check_in_date >= check_out_date:
+            raise ValueError(
+                "Check-out date must greater then check-in date and should not in same date.")
+
+
+def read_batch_queries(path: str, args) -> list[dict]:
+    # queries of a batch file (.json list or .jsonl of objects with the
+    # query_fields), missing fields are taken from the command line
+    queries = list()
+    for item in read_dataset(path):
+        query = {field: item.get(field, getattr(args, field))
+                 for field in query_fields}
+        if not query["search"]:
+            raise ValueError(f"Query {len(queries)+1} of '{path}' has no search keywords.")
+        check_dates(query["check_in"], query["check_out"])
+        queries.append(query)
+    if not queries:
+        raise ValueError(f"No query in batch file '{path}'.")
+    return queries
 
-    # save to json
+
+def get_url_query(query: dict) -> str:
+    # build up query url
+    url_query = "https://www.booking.com/searchresults.zh-tw.html"
+    url_query += f"?ss={query['search']}"
+    if query["check_in"]:
+        url_query += f"&checkin={query['check_in']}"
+    if query["check_out"]:
+        url_query += f"&checkout={query['check_out']}"
+    url_query += f"&group_adults={query['num_adults']}"
+    url_query += f"&no_room={query['num_rooms']}"
+    url_query += f"&group_children={query['num_children']}"
+    return url_query
+
+
+def get_query_filename(query: dict) -> str:
+    # result filename, also the key of the query in crawl state
     filename = f"result_{query['search']}"
     if query["check_in"]:
         filename += f"_{query['check_in']}"
@@ -296,18 +344,490 @@ def booking_web_crawler(args):
     filename += f"_room{query['num_rooms']}"
     filename += f"_adult{query['num_adults']}"
     filename += f"_child{query['num_children']}"
-    with open(f"result/{filename}.json", "w", encoding='utf8') as file:
-        json.dump(dataset, file, ensure_ascii=False, indent=5)
+    return filename
+
+
+def get_urls_from_search_result_page(driver: webdriver.Chrome,
+                                     page_url: str,
+                                     waits: Optional[WaitEngine] = None):
+    # hotel urls of one search result page at an offset, no scrolling.
+    # [] after the last result page, FetchError if the page did not load
+    waits = waits or WaitEngine()
+    with metrics.timer("browser.search_page"):
+        driver.get(page_url)
+        waits.until(driver, "search_results", element_present(
+            selector_mapping["search_result_link"].css + ", " +
+            selector_mapping["search_result_header"].css))
+        html = driver.page_source
+    links = extract_result_links(page_url, html)
+    if not links:
+        check_blocked(page_url, html, "search_result_link")
+        if not is_result_page(html):
+            raise FetchError(page_url, message=f"Search result page '{page_url}' did not load.")
+    return links
+
+
+def booking_web_crawler(args):
+    start_time = time.time()
+    metrics.reset()
+    metrics_server = metrics.serve(args.metrics_port) if args.metrics_port else None
+
+    # a worker crawls the hotels queued by a coordinator, of any query
+    worker_mode = args.role == "worker"
+    if worker_mode:
+        queries = []
+    elif args.batch:
+        queries = read_batch_queries(args.batch, args)
+    else:
+        queries = [{field: getattr(args, field) for field in query_fields}]
+
+    waits = WaitEngine(args.wait_timeout, args.settle_timeout)
+
+    # Set up pool of Selenium WebDriver sessions, shared by every query
+    pool = DriverPool(args.workers, partial(
+        create_chrome_driver,
+        headless=args.headless,
+        blocked_urls=blocking_preset_mapping[args.block]))
+
+    for query in queries:
+        print(f"Query URL: '{get_url_query(query)}'")
+    print(f"Max web-crawling items: {args.max_item}. " +
+          f"Max review page: {args.max_page}. " +
+          f"Workers: {args.workers}")
+
+    # in batch mode, the hotels of every query are crawled once into one
+    # result, and each query only lists the urls of its hotels
+    if worker_mode:
+        filename = "worker"
+    elif args.batch:
+        filename = "batch_" + os.path.splitext(os.path.basename(args.batch))[0]
+    else:
+        filename = get_query_filename(queries[0])
+    result_path = f"result/{filename}.jsonl" + \
+        compression_suffix_mapping[args.compression]
+
+    fetcher = None
+    engine = None
+    # the offset harvest fetches harvest_window result pages at once on the
+    # same connection pool as the crawl
+    harvest_connections = args.harvest_window if args.harvest == "offset" else 0
+    if args.engine == "async":
+        # retries are done by the engine, with backoff
+        fetcher = HttpFetcher(args.concurrency + harvest_connections, retries=0)
+        engine = AsyncCrawlEngine(fetcher, args.concurrency, args.rate_limit)
+    elif args.fetch == "http":
+        fetcher = HttpFetcher(args.workers + harvest_connections)
+    controller = CrawlController(
+        max(1, args.concurrency // engine.page_window) if engine else args.workers,
+        adaptive=args.adaptive,
+        max_retries=args.max_retries,
+        cooldown=args.cooldown)
+
+    def get_result_links(page_url: str) -> list[str]:
+        # one search result page at an offset, over http if possible.
+        # a page that did not load or was blocked is not the end of the
+        # results, it is loaded again after a backoff (and cooldown if blocked)
+        for attempt in range(args.max_retries + 1):
+            try:
+                if fetcher:
+                    try:
+                        return get_result_links_over_http(fetcher, page_url)
+                    except BlockedError:
+                        raise  # the browser would be blocked too
+                    except FetchError as e:
+                        print(f"\nCannot fetch search result page over HTTP. " +
+                              f"Fallback to browser. Message:\n{e}")
+                return pool.run(get_urls_from_search_result_page, page_url, waits=waits)
+            except FetchError as e:
+                kind = classify_failure(e)
+                if kind not in retried_kinds or attempt >= args.max_retries:
+                    raise
+                delay = controller.backoff(kind, attempt)
+                print(f"\n{kind.capitalize()} failure of search result page. " +
+                      f"Retry {attempt+1}/{args.max_retries} in {delay:.1f}s. Message:\n{e}")
+                time.sleep(delay)
+
+    def iter_url_batches(query: dict,
+                         known: Optional[list[str]] = None) -> Iterator[list[str]]:
+        # known urls are harvested already, only the urls after them are yielded
+        if args.harvest == "offset":
+            yield from iter_search_results(get_result_links,
+                                           get_url_query(query),
+                                           args.max_item,
+                                           window=args.workers if not fetcher
+                                           else args.harvest_window,
+                                           known=known)
+            return
+        with pool.session() as driver:  # search session joins the crawl pool
+            urls = get_urls_from_search_page(driver, get_url_query(query), waits)
+        yield urls[len(known or []):args.max_item]
+
+    def harvest_urls(query: dict) -> list[str]:
+        return [url for urls in iter_url_batches(query) for url in urls]
+
+    os.makedirs("result", exist_ok=True)
+    state = CrawlState()
+    streaming = False
+    # a single query keeps the urls of an interrupted harvest, its done items
+    # are kept and the harvest continues after them
+    urls_result = state.get_urls(filename, partial=not args.batch) if args.resume else None
+    resumed = urls_result is not None
+    if worker_mode:
+        urls_result, done = list(), set()
+    elif urls_result is not None:
+        done = state.get_done(filename)
+        streaming = state.is_harvesting(filename)
+        print(f"Resume previous crawl. {len(done)}/{len(urls_result)} items done" +
+              (", continue harvest of search results." if streaming else "."))
+    else:
+        if args.resume:
+            print("No previous crawl to resume. Start a new crawl.")
+        if args.batch:
+            urls_result = list()
+            known_urls = set()
+            for query in queries:
+                query_filename = get_query_filename(query)
+                urls = state.get_urls(query_filename) if args.resume else None
+                if urls is None:
+                    urls = harvest_urls(query)[:args.max_item]
+                    state.start(query_filename, query, urls)
+                new_urls = [url for url in urls
+                            if normalize_hotel_url(url) not in known_urls]
+                known_urls.update(normalize_hotel_url(url) for url in new_urls)
+                urls_result.extend(new_urls)
+                write_query_refs(f"result/{query_filename}.refs.json",
+                                 query, result_path, urls)
+                print(f"'{query['search']}': {len(urls)} items, " +
+                      f"{len(new_urls)} not in previous queries.")
+            state.start(filename, {"batch": args.batch, "queries": queries},
+                        urls_result)
+        else:
+            # urls are crawled while the search results are being harvested
+            urls_result = list()
+            state.start(filename, queries[0], urls_result, harvested=False)
+            streaming = True
+        done = set()
+
+    index = IncrementalIndex(args.incremental) if args.incremental else None
+    review_index = ReviewIndex() if args.dedup else None
+    cache = PageCache(ttl=args.cache_ttl * 3600,
+                      max_bytes=int(args.cache_size * 1024 * 1024)) if args.cache else None
+
+    # the coordinator queues the hotels for the workers and collects their
+    # records, a worker sends every finished record back to the queue
+    queue = WorkQueue(args.queue) if args.role else None
+    worker = QueueWorker(queue,
+                         slots=args.concurrency if engine else args.workers,
+                         lease_seconds=args.lease,
+                         poll_interval=args.poll_interval) if worker_mode else None
+    if args.role == "coordinator" and not (resumed and queue.has_job(filename)):
+        queue.create_job(filename, queries[0] if not args.batch else
+                         {"batch": args.batch, "queries": queries})
+
+    def on_write(i: int):
+        # after the record is flushed to the result
+        if review_index:
+            review_index.commit(i)
+        state.mark_done(filename, i)
+        if queue:
+            queue.mark_collected(filename, i)
+
+    # stream every finished item to the result file
+    writer = None if worker_mode else \
+        JsonlWriter(result_path, args.compression, append=bool(done))
+    ordered_writer = worker or OrderedRecordWriter(writer, on_write=on_write)
+    for i in done:
+        ordered_writer.skip(i)
+    if worker_mode:
+        print(f"Crawling items of work queue '{args.queue}' " +
+              f"as worker '{worker.worker_id}'.")
+    else:
+        print(f"Saving results to '{result_path}'.")
+    spool_dir = f"result/{filename}.spool"
+    if args.stream:
+        os.makedirs(spool_dir, exist_ok=True)
+
+    # start web-crawling for every url, spread over the pool sessions
+    # and hand the captured pages over to the parse pipeline
+    if not args.batch:  # limited per query in batch mode
+        urls_result = urls_result[:args.max_item]  # item count limiter
+
+    def iter_items() -> Iterator[tuple[int, str]]:
+        if worker_mode:
+            yield from worker.iter_tasks()
+            return
+        yield from ((i, url) for i, url in enumerate(urls_result) if i not in done)
+        if not streaming:
+            return
+        try:
+            for urls in iter_url_batches(queries[0], known=list(urls_result)):
+                state.add_urls(filename, len(urls_result), urls)
+                for url in urls:
+                    urls_result.append(url)
+                    yield len(urls_result) - 1, url
+        except Exception as e:
+            # the hotels harvested so far are crawled and saved, the crawl
+            # state stays harvesting so that --resume continues the harvest
+            print(f"\nHarvest of search results stopped at {len(urls_result)} items. " +
+                  f"Use --resume to continue it. Message:\n{e}")
+            return
+        state.finish_harvest(filename)
+        print(f"Search results harvested. {len(urls_result)} items.")
+
+    def write_item(i: int, data: Optional[BookingData]):
+        if not data:  # block pages are caught before parsing
+            controller.record_failure("parse_drift")
+        if data:
+            metrics.inc("hotels")
+            metrics.inc("reviews", len(data.user_review.reviews))
+        if data and review_index:
+            data = review_index.filter(i, data)
+        if data and index:
+            data = index.merge(data)
+        ordered_writer.put(i, data.to_dict() if data else None)
+
+    # pacing, failure classification and retries of the hotels
+    def snapshot_pages(snapshot: HotelSnapshot) -> int:
+        return 1 + len(snapshot.review_pages)
+
+    pipeline = ParsePipeline(write_item,
+                             args.parse_workers,
+                             parser_backend=args.parser)
+
+    def use_cache(url: str) -> bool:
+        # hotels of incremental mode need their newest reviews, not cached ones
+        return bool(cache) and not (index and index.get(url))
+
+    def item_hooks(i: int, url: str):
+        # resumed snapshot, checkpoint of every page, incremental stop.
+        # no checkpoint in worker mode, another node takes over the hotel
+        snapshot = None if worker_mode else state.load_snapshot(filename, i, url)
+        snapshot = snapshot or HotelSnapshot(url)
+
+        def on_page(page: int, html: str):
+            if not worker_mode:
+                state.save_page(filename, i, page, html)
+            if cache:
+                cache.put(url, page, html)
+
+        stop_page = (lambda html: index.reached_known_reviews(url, html)) \
+            if index and index.get(url) else None
+        return snapshot, on_page, stop_page
+
+    def capture_item_by_browser(url: str, snapshot, on_page, stop_page):
+        return pool.run(get_snapshot_from_hotel_page,
+                        url,
+                        args.max_page,
+                        waits=waits,
+                        snapshot=snapshot,
+                        on_page=on_page,
+                        stop_page=stop_page)
+
+    def item_progress(i: int) -> str:
+        return f"task {i}" if worker_mode else f"item {i+1}/{len(urls_result)}"
+
+    def queue_items():
+        # coordinator: the workers crawl the items, streamed in while harvesting
+        for i, url in iter_items():
+            queue.add_urls(filename, i, [url])
+        queue.finish_harvest(filename)
+
+    def collect_results(harvest):
+        # coordinator: write the records of the workers in order, until
+        # every item of the job is done or failed
+        collected = set(done) | queue.get_collected(filename)
+        while True:
+            if harvest.done():
+                harvest.result()  # raise error of harvest
+            finished = queue.is_finished(filename)
+            for i, result in queue.get_results(filename, collected):
+                ordered_writer.put(i, QueuedRecord(result) if result else None)
+                collected.add(i)
+            if finished:
+                print(f"Work queue: {queue.stats(filename)}.")
+                return
+            time.sleep(args.poll_interval)
+
+    def stream_item_by_browser(driver: webdriver.Chrome, i: int, url: str):
+        # reviews go to the spool of the item page by page, never all in memory.
+        # the spool restarts if the session breaks and the item is retried,
+        # and so do the review hashes selected for it (indexed once written)
+        spool = HotelRecordSpool(f"{spool_dir}/{i}.jsonl")
+        spool.reset()
+        if review_index:
+            review_index.discard(i)
+        for item in iter_hotel_reviews(driver, url, args.max_page, waits):
+            if isinstance(item, BookingData):
+                spool.set_header(item.to_dict())
+                metrics.inc("hotels")
+                continue
+            metrics.inc("reviews", len(item))
+            if review_index:
+                item = review_index.select(i, url, item)
+            spool.add_reviews([review.to_dict() for review in item])
+        return spool
+
+    def stream_item(i: int, url: str):
+        print(f"Web-crawling {item_progress(i)}...")
+        try:
+            with metrics.timer("crawl.capture"):
+                spool = controller.run(pool.run, stream_item_by_browser, i, url,
+                                       pages=lambda spool: spool.page_count)
+            ordered_writer.put(i, spool)
+        except Exception as e:
+            print(f"\nError when web-crawling item {i+1} " +
+                  f"({classify_failure(e) or 'error'}). Skip. Message:\n{e}")
+            HotelRecordSpool(f"{spool_dir}/{i}.jsonl").remove()
+            if review_index:
+                review_index.discard(i)
+            ordered_writer.skip(i)
+
+    def capture_item(i: int, url: str):
+        snapshot, on_page, stop_page = item_hooks(i, url)
+        if fetcher:
+            try:
+                return get_snapshot_over_http(fetcher,
+                                              url,
+                                              args.max_page,
+                                              snapshot=snapshot,
+                                              on_page=on_page,
+                                              stop_page=stop_page)
+            except BlockedError:
+                raise  # to the controller, for the cooldown
+            except FetchError as e:
+                print(f"\nCannot fetch item {i+1} over HTTP. " +
+                      f"Fallback to browser. Message:\n{e}")
+        return capture_item_by_browser(url, snapshot, on_page, stop_page)
+
+    def crawl_item(i: int, url: str):
+        print(f"Web-crawling {item_progress(i)}...")
+        try:
+            snapshot = cache.get_snapshot(url, args.max_page) if use_cache(url) else None
+            if not snapshot:
+                with metrics.timer("crawl.capture"):
+                    snapshot = controller.run(capture_item, i, url, pages=snapshot_pages)
+                if use_cache(url):
+                    cache.mark_complete(url, len(snapshot.review_pages), args.max_page)
+            pipeline.submit(i, snapshot)
+        except Exception as e:
+            print(f"\nError when web-crawling item {i+1} " +
+                  f"({classify_failure(e) or 'error'}). Skip. Message:\n{e}")
+            ordered_writer.skip(i)
+
+    async def capture_item_async(i: int, url: str):
+        snapshot, on_page, stop_page = item_hooks(i, url)
+        try:
+            return await engine.get_snapshot(url,
+                                             args.max_page,
+                                             snapshot=snapshot,
+                                             on_page=on_page,
+                                             stop_page=stop_page)
+        except BlockedError:
+            raise  # to the controller, for the cooldown
+        except FetchError as e:
+            print(f"\nCannot fetch item {i+1} over HTTP. " +
+                  f"Fallback to browser. Message:\n{e}")
+            return await asyncio.to_thread(capture_item_by_browser,
+                                           url, snapshot, on_page, stop_page)
+
+    async def crawl_item_async(i: int, url: str):
+        print(f"Web-crawling {item_progress(i)}...")
+        try:
+            snapshot = await asyncio.to_thread(cache.get_snapshot, url, args.max_page) \
+                if use_cache(url) else None
+            if snapshot:
+                await asyncio.to_thread(pipeline.submit, i, snapshot)
+                return
+            capture_start_time = time.perf_counter()
+            snapshot = await controller.run_async(capture_item_async, i, url,
+                                                  pages=snapshot_pages)
+            metrics.observe("crawl.capture", time.perf_counter() - capture_start_time)
+            if use_cache(url):
+                cache.mark_complete(url, len(snapshot.review_pages), args.max_page)
+            # submit may wait for a free slot of the parse queue
+            await asyncio.to_thread(pipeline.submit, i, snapshot)
+        except Exception as e:
+            print(f"\nError when web-crawling item {i+1} " +
+                  f"({classify_failure(e) or 'error'}). Skip. Message:\n{e}")
+            ordered_writer.skip(i)
 
+    executor = None if engine and args.role != "coordinator" else \
+        ThreadPoolExecutor(max_workers=args.workers)
+    try:
+        if args.role == "coordinator":
+            collect_results(executor.submit(queue_items))
+        elif engine:
+            engine.run(iter_items(), crawl_item_async)
+        else:
+            futures = [executor.submit(stream_item if args.stream else crawl_item, *item)
+                       for item in iter_items()]
+            for future in futures:
+                future.result()
+        if len(urls_result) >= args.max_item and not worker_mode:
+            print("Max item reached. Saving data at current position.")
+    except KeyboardInterrupt:
+        print("\nStop by user. Saving data at current position. " +
+              "Use --resume to continue.")
+        # let running items finish, drop the queued ones
+        if executor:
+            executor.shutdown(wait=True, cancel_futures=True)
+    if executor:
+        executor.shutdown(wait=True)
+    pool.close()
+    if args.role != "coordinator":
+        controller.print_summary()
+    if engine:
+        engine.print_summary()
+    if fetcher:
+        fetcher.print_summary()
+        fetcher.close()
+    pipeline.close()
+    ordered_writer.flush_pending()
+    if index:
+        for record in index.remaining():
+            writer.write(record)
+    if worker:
+        worker.close()
+    if queue:
+        queue.close()
+    if writer:
+        writer.close()
+    state.close()
+    if args.stream and not os.listdir(spool_dir):
+        os.rmdir(spool_dir)  # spools of unwritten items are kept
+    if cache:
+        cache.print_summary()
+        cache.close()
+    if review_index:
+        print(f"Review index: {review_index.skipped_count} duplicate reviews skipped, " +
+              f"{review_index.count()} reviews indexed.")
+        review_index.close()
+
+    if worker_mode:
+        result_path = None
+    if args.compact:
+        compact_jsonl(result_path)
+    if args.export:
+        export_dataset(result_path, file_format=args.export)
+
+    waits.print_summary()
+    metrics.print_summary()
+    metrics.write_summary(f"result/{filename}.metrics.json",
+                          {"result": result_path, "args": vars(args)})
+    if metrics_server:
+        metrics_server.shutdown()
     end_time = time.time()
     print(f"Total execution time: {timedelta(seconds=end_time-start_time)}. " +
-          f"Dataset length: {len(dataset)}.")
+          f"Dataset length: {writer.count if writer else worker.done_count}.")
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("-s", "--search", type=str,
-                        help="Search keywords.", required=True)
+                        help="Search keywords.")
+    parser.add_argument("-b", "--batch", type=str,
+                        help="File of queries (.json or .jsonl) crawled over " +
+                        "shared sessions, each hotel once.")
     parser.add_argument("-ci", "--check_in", type=str,
                         help="Check-in date. Format: yyyy-MM-dd")
     parser.add_argument("-co", "--check_out", type=str,
@@ -318,32 +838,113 @@ if __name__ == "__main__":
                         help="Number of children.", default=0)
     parser.add_argument("-nr", "--num_rooms", type=int,
                         help="Number of rooms.", default=1)
+    parser.add_argument("-hv", "--harvest", type=str, choices=["scroll", "offset"],
+                        help="How to harvest search results. offset requests " +
+                        "result pages in parallel and starts crawling at once.",
+                        default="scroll")
+    parser.add_argument("-hw", "--harvest_window", type=int,
+                        help="Result pages requested at once over http " +
+                        "with --harvest offset.", default=8)
     parser.add_argument("-mp", "--max_page", type=int,
                         help="Number of max review page.", default=999)
     parser.add_argument("-mi", "--max_item", type=int,
                         help="Number of max result items.", default=999)
+    parser.add_argument("-w", "--workers", type=int,
+                        help="Number of parallel browser sessions.", default=1)
+    parser.add_argument("-wt", "--wait_timeout", type=float,
+                        help="Max seconds to wait for page content.", default=10)
+    parser.add_argument("-st", "--settle_timeout", type=float,
+                        help="Max seconds to wait for lazy load and page changes.",
+                        default=3)
+    parser.add_argument("-hl", "--headless", action="store_true",
+                        help="Run chrome without window.")
+    parser.add_argument("-bl", "--block", type=str,
+                        choices=list(blocking_preset_mapping),
+                        help="Requests blocked by chrome. safe: images, fonts, " +
+                        "media and trackers. aggressive: also css.", default="safe")
+    parser.add_argument("-pw", "--parse_workers", type=int,
+                        help="Number of parser processes. Default: number of CPU cores.")
+    parser.add_argument("-p", "--parser", type=str, choices=["html.parser", "lxml"],
+                        help="HTML parser backend. lxml needs 'pip install lxml'.",
+                        default="html.parser")
+    parser.add_argument("-cp", "--compression", type=str, choices=["gzip", "zstd"],
+                        help="Compression of the .jsonl result.")
+    parser.add_argument("--compact", action="store_true",
+                        help="Also compact the .jsonl result into a pretty .json file.")
+    parser.add_argument("-ex", "--export", type=str, choices=["parquet", "arrow"],
+                        help="Also export the result into hotels and reviews tables. " +
+                        "Needs 'pip install pyarrow'.")
+    parser.add_argument("-sm", "--stream", action="store_true",
+                        help="Stream reviews page by page to disk while crawling, " +
+                        "for hotels with very many reviews.")
+    parser.add_argument("-r", "--resume", action="store_true",
+                        help="Resume the previous interrupted crawl of the same query.")
+    parser.add_argument("-inc", "--incremental", type=str,
+                        help="Previous result to update with the new reviews only.")
+    parser.add_argument("-dd", "--dedup", action="store_true",
+                        help="Save only the reviews not saved by previous runs.")
+    parser.add_argument("-ca", "--cache", action="store_true",
+                        help="Reuse the pages cached by previous runs of any query.")
+    parser.add_argument("-ct", "--cache_ttl", type=float,
+                        help="Hours a cached page is reused.", default=24)
+    parser.add_argument("-cs", "--cache_size", type=float,
+                        help="Max MiB of the page cache.", default=1024)
+    parser.add_argument("-ro", "--role", type=str, choices=["coordinator", "worker"],
+                        help="Share the crawl over nodes. coordinator queues the hotels " +
+                        "and collects the results, worker crawls queued hotels.")
+    parser.add_argument("-q", "--queue", type=str,
+                        help="Path of work queue shared by coordinator and workers.",
+                        default="result/work_queue.sqlite")
+    parser.add_argument("-ls", "--lease", type=float,
+                        help="Seconds a worker holds a hotel without heartbeat.",
+                        default=60)
+    parser.add_argument("-pi", "--poll_interval", type=float,
+                        help="Seconds between checks of the work queue.", default=2)
+    parser.add_argument("-f", "--fetch", type=str, choices=["browser", "http"],
+                        help="How to fetch hotel pages. http falls back to browser " +
+                        "when content is missing.", default="browser")
+    parser.add_argument("-mport", "--metrics_port", type=int,
+                        help="Serve Prometheus metrics at " +
+                        "http://127.0.0.1:<port>/metrics during the crawl.")
+    parser.add_argument("-e", "--engine", type=str, choices=["sync", "async"],
+                        help="Crawl engine. async implies --fetch http.", default="sync")
+    parser.add_argument("-ad", "--adaptive", action="store_true",
+                        help="Adjust hotels in flight and spacing of hotels to " +
+                        "latency, failures and challenge pages.")
+    parser.add_argument("-mr", "--max_retries", type=int,
+                        help="Retries of a hotel after a transient failure or a " +
+                        "challenge page.", default=2)
+    parser.add_argument("-cd", "--cooldown", type=float,
+                        help="Seconds every hotel waits after a challenge page.",
+                        default=60)
+    parser.add_argument("-cc", "--concurrency", type=int,
+                        help="Max requests in flight with async engine.", default=100)
+    parser.add_argument("-rl", "--rate_limit", type=float,
+                        help="Max requests per second per host with async engine.",
+                        default=10)
     args = parser.parse_args()
 
-    # check-in and check-out date checker
-    if args.check_in or args.check_out:
-        if not (args.check_in and args.check_out):
-            raise ValueError(
-                "Check-in and check-out date must be used at same time.")
-
-        current_date = datetime.now().date()
-        try:
-            check_in_date = datetime.strptime(args.check_in, "%Y-%m-%d").date()
-            check_out_date = datetime.strptime(
-                args.check_out, "%Y-%m-%d").date()
-        except:
-            raise ValueError(
-                "Invalid date format for check-in or check-out date. should be \"yyyy-MM-dd\"")
-
-        if check_in_date < current_date or check_out_date < current_date:
-            raise ValueError(
-                "Check-in or check-out date cannot be an past date.")
-        if check_in_date >= check_out_date:
-            raise ValueError(
-                "Check-out date must greater then check-in date and should not in same date.")
+    if not (args.search or args.batch or args.role == "worker"):
+        raise ValueError("Search keywords or batch file is required.")
+    check_dates(args.check_in, args.check_out)
+
+    if args.workers < 1:
+        raise ValueError("Number of workers must be at least 1.")
+    if args.parse_workers is not None and args.parse_workers < 1:
+        raise ValueError("Number of parse workers must be at least 1.")
+    if args.max_retries < 0 or args.cooldown < 0:
+        raise ValueError("Max retries and cooldown must not be negative.")
+    if args.concurrency < 1 or args.rate_limit <= 0:
+        raise ValueError("Concurrency and rate limit must be greater than 0.")
+    if args.engine == "async":
+        args.fetch = "http"
+    if args.role and (args.incremental or args.dedup):
+        raise ValueError("--incremental and --dedup do not work with --role.")
+    if args.role == "worker" and (args.resume or args.compact or args.export):
+        raise ValueError("--resume, --compact and --export are for the coordinator.")
+    if args.stream and (args.fetch == "http" or args.incremental or args.cache):
+        raise ValueError("--stream works with browser fetching only, " +
+                         "without --incremental and --cache.")
+    set_parser_backend(args.parser)
 
     booking_web_crawler(args)
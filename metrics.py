@@ -0,0 +1,194 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+# upper bounds (seconds) of latency histogram buckets, from a field
+# extraction (microseconds) to a page turn in a slow browser (seconds)
+latency_buckets = (0.00002, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# counters divided by the run time in summary, name: rate name
+rate_mapping = {
+    "hotels": "hotels_per_second",
+    "reviews": "reviews_per_second"
+}
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(latency_buckets) + 1)  # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(latency_buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        # estimated from the buckets, interpolated inside the bucket
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if cumulative + count >= rank and count:
+                lower = latency_buckets[i-1] if i > 0 else 0.0
+                upper = latency_buckets[i] if i < len(latency_buckets) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - cumulative) / count)
+            cumulative += count
+        return self.max
+
+    def export(self) -> dict:
+        return {"counts": self.counts, "count": self.count,
+                "sum": self.sum, "max": self.max}
+
+    def merge(self, data: dict):
+        self.counts = [a + b for a, b in zip(self.counts, data["counts"])]
+        self.count += data["count"]
+        self.sum += data["sum"]
+        self.max = max(self.max, data["max"])
+
+
+class Metrics:
+    # latency histograms per phase and counters of one run, shared by every
+    # crawling thread. parse workers send theirs back with every parsed item
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.histograms: dict[str, Histogram] = {}
+            self.counters: dict[str, int] = {}
+            self.start_time = time.time()
+
+    def observe(self, phase: str, seconds: float):
+        with self._lock:
+            if phase not in self.histograms:
+                self.histograms[phase] = Histogram()
+            self.histograms[phase].observe(seconds)
+
+    @contextmanager
+    def timer(self, phase: str):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(phase, time.perf_counter() - start_time)
+
+    def inc(self, counter: str, value: int = 1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def export(self) -> dict:
+        with self._lock:
+            return {"histograms": {phase: histogram.export()
+                                   for phase, histogram in self.histograms.items()},
+                    "counters": dict(self.counters)}
+
+    def merge(self, data: dict):
+        # add the metrics exported by another process
+        with self._lock:
+            for phase, histogram in data["histograms"].items():
+                if phase not in self.histograms:
+                    self.histograms[phase] = Histogram()
+                self.histograms[phase].merge(histogram)
+            for counter, value in data["counters"].items():
+                self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def summary(self) -> dict:
+        elapsed = time.time() - self.start_time
+        with self._lock:
+            phases = dict()
+            for phase, histogram in sorted(self.histograms.items()):
+                phases[phase] = {
+                    "count": histogram.count,
+                    "total": round(histogram.sum, 6),
+                    "average": round(histogram.sum / histogram.count, 6),
+                    "p50": round(histogram.quantile(0.5), 6),
+                    "p95": round(histogram.quantile(0.95), 6),
+                    "max": round(histogram.max, 6)
+                }
+            counters = dict(sorted(self.counters.items()))
+        rates = {rate: round(counters.get(counter, 0) / elapsed, 3)
+                 for counter, rate in rate_mapping.items()} if elapsed else {}
+        return {"elapsed": round(elapsed, 3), "counters": counters,
+                "rates": rates, "phases": phases}
+
+    def write_summary(self, path: str, extra: Optional[dict] = None):
+        with open(path, "w", encoding='utf8') as file:
+            json.dump({**(extra or {}), **self.summary()}, file,
+                      ensure_ascii=False, indent=4)
+        print(f"Metrics saved to '{path}'.")
+
+    def print_summary(self):
+        summary = self.summary()
+        print("Phase summary:")
+        for phase, item in summary["phases"].items():
+            print(f"  {phase}: {item['count']} times, total {item['total']:.3f}s, " +
+                  f"p50 {item['p50'] * 1000:.1f}ms, p95 {item['p95'] * 1000:.1f}ms, " +
+                  f"max {item['max'] * 1000:.1f}ms")
+        print("  " + ", ".join(f"{name} {value}" for name, value in
+                               {**summary["counters"], **summary["rates"]}.items()))
+
+    def to_prometheus(self, prefix: str = "booking_crawler") -> str:
+        # prometheus text exposition format
+        summary = self.summary()
+        lines = [f"# TYPE {prefix}_phase_seconds histogram"]
+        with self._lock:
+            for phase, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(latency_buckets + ("+Inf",), histogram.counts):
+                    cumulative += count
+                    lines.append(f'{prefix}_phase_seconds_bucket{{phase="{phase}",' +
+                                 f'le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_phase_seconds_sum{{phase="{phase}"}} ' +
+                             f'{histogram.sum}')
+                lines.append(f'{prefix}_phase_seconds_count{{phase="{phase}"}} ' +
+                             f'{histogram.count}')
+        for counter, value in summary["counters"].items():
+            lines.append(f"# TYPE {prefix}_{counter}_total counter")
+            lines.append(f"{prefix}_{counter}_total {value}")
+        for rate, value in summary["rates"].items():
+            lines.append(f"# TYPE {prefix}_{rate} gauge")
+            lines.append(f"{prefix}_{rate} {value}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        # /metrics endpoint in a daemon thread, for the time of the run
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.to_prometheus().encode("utf8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                None  # keep the crawler output clean
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Metrics served at 'http://{host}:{port}/metrics'.")
+        return server
+
+
+# metrics of the current process
+metrics = Metrics()
@@ -0,0 +1,311 @@
+import argparse
+import gzip
+import io
+import json
+import os
+import threading
+from typing import Callable, Iterator, Optional
+from data_model_booking import normalize_hotel_url
+
+compression_suffix_mapping = {
+    None: "",
+    "gzip": ".gz",
+    "zstd": ".zst"
+}
+
+
+def _import_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(
+            "zstd compression requires the 'zstandard' package. " +
+            "Install it with 'pip install zstandard'.")
+    return zstandard
+
+
+def compression_from_path(path: str) -> Optional[str]:
+    for compression, suffix in compression_suffix_mapping.items():
+        if suffix and path.endswith(suffix):
+            return compression
+    return None
+
+
+class JsonlWriter:
+    # append one json record per line, flushed record by record so a crash
+    # only loses the record being written
+    def __init__(self,
+                 path: str,
+                 compression: Optional[str] = None,
+                 append: bool = False):
+        if compression not in compression_suffix_mapping:
+            raise ValueError(f"Unknown compression '{compression}'.")
+        self.path = path
+        self.compression = compression
+        self.count = 0
+        self._lock = threading.Lock()
+        self._zstd_writer = None
+        mode = "ab" if append else "wb"
+        if compression == "gzip":
+            self._file = gzip.open(path, mode)
+        elif compression == "zstd":
+            zstandard = _import_zstandard()
+            self._file = open(path, mode)
+            self._zstd_writer = zstandard.ZstdCompressor().stream_writer(
+                self._file, closefd=False)
+        else:
+            self._file = open(path, mode)
+
+    def write(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._write_bytes(line.encode("utf8"))
+            self.count += 1
+
+    def write_chunks(self, chunks: Iterator[str]):
+        # one record given in pieces (ending with a newline), for records
+        # too large to be built in memory
+        with self._lock:
+            for chunk in chunks:
+                self._write_bytes(chunk.encode("utf8"), flush=False)
+            self._flush()
+            self.count += 1
+
+    def _write_bytes(self, content: bytes, flush: bool = True):
+        if self._zstd_writer:
+            self._zstd_writer.write(content)
+        else:
+            self._file.write(content)
+        if flush:
+            self._flush()
+
+    def _flush(self):
+        if self._zstd_writer:
+            # every record is an own zstd frame, readable even after a crash
+            zstandard = _import_zstandard()
+            self._zstd_writer.flush(zstandard.FLUSH_FRAME)
+        else:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._zstd_writer:
+                self._zstd_writer.close()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class OrderedRecordWriter:
+    # records finish out of order when crawling in parallel, write each one
+    # as soon as every record before it is written (or skipped)
+    def __init__(self,
+                 writer: JsonlWriter,
+                 start_index: int = 0,
+                 on_write: Optional[Callable[[int], None]] = None):
+        self.writer = writer
+        self.next_index = start_index
+        self.on_write = on_write or (lambda index: None)
+        self._pending: dict[int, Optional[dict]] = {}
+        self._lock = threading.Lock()
+
+    def put(self, index: int, record: Optional[dict]):
+        with self._lock:
+            self._pending[index] = record
+            while self.next_index in self._pending:
+                self._write(self.next_index,
+                            self._pending.pop(self.next_index))
+                self.next_index += 1
+
+    def _write(self, index: int, record):
+        # record is a dict, or a HotelRecordSpool streamed into the writer
+        if record is not None:
+            if isinstance(record, dict):
+                self.writer.write(record)
+            else:
+                record.write_to(self.writer)
+            self.on_write(index)
+
+    def skip(self, index: int):
+        self.put(index, None)
+
+    def flush_pending(self):
+        # write records still waiting for an earlier one (e.g. on stop by user)
+        with self._lock:
+            for index in sorted(self._pending):
+                self._write(index, self._pending.pop(index))
+
+
+class HotelRecordSpool:
+    # one hotel record built on disk while it is crawled: the header (hotel
+    # data and overall rating) and the reviews appended page by page, one
+    # json line each, so the reviews seen so far are visible in the spool
+    # file and only one page of reviews is in memory
+    def __init__(self, path: str):
+        self.path = path
+        self.header: Optional[dict] = None
+        self.review_count = 0
+        self.page_count = 0
+        self._file = None
+
+    def reset(self):
+        # drop a partial capture (e.g. before a retry)
+        self.close()
+        self.header = None
+        self.review_count = 0
+        self.page_count = 0
+        self._file = open(self.path, "w", encoding='utf8')
+
+    def set_header(self, record: dict):
+        self.header = record
+        self.page_count += 1
+
+    def add_reviews(self, reviews: list[dict]):
+        if self._file is None:
+            self.reset()
+        for review in reviews:
+            self._file.write(json.dumps(review, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self.review_count += len(reviews)
+        self.page_count += 1
+
+    def chunks(self) -> Iterator[str]:
+        # the same json line as json.dumps(record) of the whole record,
+        # "reviews" is the last key of "user_review", the last key of record
+        self.close()
+        user_review = {**self.header["user_review"],
+                       "count_crawled": self.review_count, "reviews": []}
+        head = json.dumps({**self.header, "user_review": user_review},
+                          ensure_ascii=False)
+        yield head[:-len("[]}}")] + "["
+        if self.review_count:
+            with open(self.path, "r", encoding='utf8') as file:
+                for i, line in enumerate(file):
+                    yield (", " if i else "") + line.rstrip("\n")
+        yield "]}}\n"
+
+    def write_to(self, writer: JsonlWriter):
+        writer.write_chunks(self.chunks())
+        self.remove()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def open_jsonl(path: str) -> io.TextIOBase:
+    compression = compression_from_path(path)
+    if compression == "gzip":
+        return gzip.open(path, "rt", encoding="utf8")
+    if compression == "zstd":
+        zstandard = _import_zstandard()
+        reader = zstandard.ZstdDecompressor().stream_reader(
+            open(path, "rb"), read_across_frames=True, closefd=True)
+        return io.TextIOWrapper(reader, encoding="utf8")
+    return open(path, "r", encoding="utf8")
+
+
+def read_jsonl(path: str) -> Iterator[dict]:
+    with open_jsonl(path) as file:
+        try:
+            for line in file:
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # last record cut off by a crash
+                    print(f"Skip broken record in '{path}'.")
+        except EOFError:
+            # compressed stream cut off by a crash
+            print(f"'{path}' is truncated. Read until last complete record.")
+
+
+def _write_pretty_json(records: Iterator[dict], json_path: str) -> int:
+    # the pretty json array format, one record in memory at a time
+    count = 0
+    with open(json_path, "w", encoding='utf8') as file:
+        file.write("[")
+        for record in records:
+            file.write(",\n" if count else "\n")
+            content = json.dumps(record, ensure_ascii=False, indent=5)
+            file.write("\n".join(" " * 5 + line
+                                 for line in content.split("\n")))
+            count += 1
+        file.write("\n]" if count else "]")
+    return count
+
+
+def compact_jsonl(jsonl_path: str, json_path: Optional[str] = None) -> str:
+    if not json_path:
+        json_path = jsonl_path
+        suffix = compression_suffix_mapping[compression_from_path(jsonl_path)]
+        if suffix:
+            json_path = json_path[:-len(suffix)]
+        json_path = os.path.splitext(json_path)[0] + ".json"
+
+    count = _write_pretty_json(read_jsonl(jsonl_path), json_path)
+    print(f"Compacted {count} records to '{json_path}'.")
+    return json_path
+
+
+def write_query_refs(path: str, query: dict, result_path: str, urls: list[str]):
+    # result of one query of a batch, its hotels are referenced by url
+    # in the result shared by every query of the batch (path relative to
+    # the refs file)
+    with open(path, "w", encoding='utf8') as file:
+        json.dump({
+            "query": query,
+            "result": os.path.relpath(result_path, os.path.dirname(path) or "."),
+            "urls": [normalize_hotel_url(url) for url in urls]
+        }, file, ensure_ascii=False, indent=4)
+
+
+def read_query_records(refs_path: str) -> Iterator[dict]:
+    # records of the hotels of one query of a batch, in order of its results
+    with open(refs_path, "r", encoding='utf8') as file:
+        refs = json.load(file)
+    positions = dict()
+    for position, url in enumerate(refs["urls"]):
+        positions.setdefault(url, position)
+    records = dict()
+    result_path = os.path.join(os.path.dirname(refs_path), refs["result"])
+    for record in read_jsonl(result_path):
+        if record.get("url") in positions:
+            records[positions[record["url"]]] = record
+    for position in sorted(records):
+        yield records[position]
+
+
+def resolve_query_refs(refs_path: str, json_path: Optional[str] = None) -> str:
+    # copy the records of one query of a batch into its own pretty .json
+    json_path = json_path or refs_path[:-len(".refs.json")] + ".json"
+    count = _write_pretty_json(read_query_records(refs_path), json_path)
+    print(f"Resolved {count} records to '{json_path}'.")
+    return json_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compact a .jsonl result into the pretty .json format.")
+    parser.add_argument("input", type=str,
+                        help="Path of .jsonl, .jsonl.gz or .jsonl.zst result, " +
+                        "or .refs.json of a query of a batch.")
+    parser.add_argument("-o", "--output", type=str,
+                        help="Path of .json output. Default: same name as input.")
+    args = parser.parse_args()
+
+    if args.input.endswith(".refs.json"):
+        resolve_query_refs(args.input, args.output)
+    else:
+        compact_jsonl(args.input, args.output)
@@ -0,0 +1,193 @@
+import argparse
+import hashlib
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Optional
+from data_model_booking import normalize_hotel_url
+from parser_booking import HotelSnapshot
+
+
+class PageCache:
+    # on-disk cache of raw pages, shared by every query. pages are keyed by
+    # the hotel url without query (dates, guests, session ids) and the page
+    # number (0 is the hotel page, 1..n are the review pages), and stored
+    # once per content hash. entries expire after ttl seconds, and the least
+    # recently used pages are evicted over max_bytes of compressed html
+    def __init__(self,
+                 path: str = "result/page_cache.sqlite",
+                 ttl: float = 24 * 3600,
+                 max_bytes: int = 1024 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hit_count = 0
+        self.miss_count = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS blobs (
+                content_hash TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                html BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                content_hash TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (url, page)
+            );
+            CREATE INDEX IF NOT EXISTS pages_accessed_at ON pages (accessed_at);
+            CREATE TABLE IF NOT EXISTS hotels (
+                url TEXT PRIMARY KEY,
+                page_count INTEGER NOT NULL,
+                capped INTEGER NOT NULL,
+                completed_at REAL NOT NULL
+            );
+        ''')
+        with self._lock:
+            self._purge_expired()
+            self._size = self._conn.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+            self._conn.commit()
+
+    def _purge_expired(self):
+        expired_at = time.time() - self.ttl
+        self._conn.execute('DELETE FROM pages WHERE fetched_at < ?', (expired_at,))
+        self._conn.execute('DELETE FROM hotels WHERE completed_at < ?', (expired_at,))
+        self._delete_orphan_blobs()
+
+    def _delete_orphan_blobs(self):
+        self._conn.execute(
+            'DELETE FROM blobs WHERE content_hash NOT IN ' +
+            '(SELECT content_hash FROM pages)')
+
+    def put(self, url: str, page: int, html: str):
+        data = html.encode("utf8")
+        content_hash = hashlib.sha256(data).hexdigest()
+        now = time.time()
+        with self._lock:
+            if not self._conn.execute('SELECT 1 FROM blobs WHERE content_hash = ?',
+                                      (content_hash,)).fetchone():
+                blob = zlib.compress(data)
+                self._conn.execute('INSERT INTO blobs VALUES (?, ?, ?)',
+                                   (content_hash, len(blob), blob))
+                self._size += len(blob)
+            self._conn.execute(
+                'INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)',
+                (normalize_hotel_url(url), page, content_hash, now, now))
+            if self._size > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        # drop least recently used pages until the cache fits in max_bytes
+        self._delete_orphan_blobs()
+        self._size = self._conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+        target = self.max_bytes * 0.9  # some room before evicting again
+        rows = self._conn.execute(
+            'SELECT pages.url, pages.page, blobs.size FROM pages ' +
+            'JOIN blobs ON pages.content_hash = blobs.content_hash ' +
+            'ORDER BY pages.accessed_at').fetchall()
+        for url, page, size in rows:
+            if self._size <= target:
+                break
+            self._conn.execute('DELETE FROM pages WHERE url = ? AND page = ?',
+                               (url, page))
+            self._size -= size  # shared blobs make this an estimate
+        self._delete_orphan_blobs()
+        self._size = self._conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+
+    def mark_complete(self, url: str, page_count: int, max_page: int):
+        # every page of the hotel up to page_count is cached. capped if the
+        # capture stopped at max_page, not at the last review page
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO hotels VALUES (?, ?, ?, ?)',
+                (normalize_hotel_url(url), page_count,
+                 int(page_count >= max_page), time.time()))
+            self._conn.commit()
+
+    def get_snapshot(self, url: str, max_page: int) -> Optional[HotelSnapshot]:
+        # the cached pages of a completely captured hotel, None on miss
+        key = normalize_hotel_url(url)
+        now = time.time()
+        with self._lock:
+            hotel = self._conn.execute(
+                'SELECT page_count, capped FROM hotels ' +
+                'WHERE url = ? AND completed_at >= ?',
+                (key, now - self.ttl)).fetchone()
+            rows = list()
+            if hotel and (hotel[0] >= max_page or not hotel[1]):
+                page_count = min(hotel[0], max_page)
+                rows = self._conn.execute(
+                    'SELECT pages.page, blobs.html FROM pages ' +
+                    'JOIN blobs ON pages.content_hash = blobs.content_hash ' +
+                    'WHERE pages.url = ? AND pages.page <= ? AND pages.fetched_at >= ? ' +
+                    'ORDER BY pages.page',
+                    (key, page_count, now - self.ttl)).fetchall()
+                if [row[0] for row in rows] != list(range(page_count + 1)):
+                    rows = list()  # some page expired or evicted
+            if not rows:
+                self.miss_count += 1
+                return None
+            self._conn.execute(
+                'UPDATE pages SET accessed_at = ? WHERE url = ? AND page <= ?',
+                (now, key, page_count))
+            self._conn.commit()
+            self.hit_count += 1
+
+        snapshot = HotelSnapshot(url)
+        snapshot.hotel_html = zlib.decompress(rows[0][1]).decode("utf8")
+        snapshot.review_pages = [zlib.decompress(row[1]).decode("utf8")
+                                 for row in rows[1:]]
+        return snapshot
+
+    def stats(self) -> tuple[int, int, int]:
+        # number of complete hotels, number of pages, bytes of compressed html
+        with self._lock:
+            hotel_count, page_count = self._conn.execute(
+                'SELECT (SELECT COUNT(*) FROM hotels), ' +
+                '(SELECT COUNT(*) FROM pages)').fetchone()
+        return hotel_count, page_count, self._size
+
+    def print_summary(self):
+        print(f"Page cache: {self.hit_count} hotels from cache, " +
+              f"{self.miss_count} crawled, {self._size / 1024 / 1024:.1f} MiB cached.")
+
+    def clear(self):
+        with self._lock:
+            self._conn.executescript('''
+                DELETE FROM hotels;
+                DELETE FROM pages;
+                DELETE FROM blobs;
+            ''')
+            self._conn.commit()
+            self._conn.execute('VACUUM')
+            self._size = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show or clear the page cache.")
+    parser.add_argument("-pa", "--path", type=str,
+                        help="Path of page cache.", default="result/page_cache.sqlite")
+    parser.add_argument("--clear", action="store_true",
+                        help="Remove every cached page.")
+    args = parser.parse_args()
+
+    cache = PageCache(args.path, ttl=float("inf"), max_bytes=float("inf"))
+    if args.clear:
+        cache.clear()
+    hotel_count, page_count, size = cache.stats()
+    print(f"{hotel_count} hotels, {page_count} pages, " +
+          f"{size / 1024 / 1024:.1f} MiB in '{args.path}'.")
+    cache.close()
@@ -0,0 +1,66 @@
+import os
+import signal
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Optional
+from data_model_booking import BookingData
+from metrics import metrics
+from parser_booking import HotelSnapshot, parse_snapshot, set_parser_backend
+from selector_booking import selector_version
+
+
+def _init_worker(parser_backend: str):
+    # let the crawler process decide what to do on Ctrl+C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    set_parser_backend(parser_backend)
+
+
+def _parse(snapshot: HotelSnapshot) -> tuple[BookingData, dict]:
+    # parse metrics of the worker are sent back with the item
+    metrics.reset()
+    with metrics.timer("parse.snapshot"):
+        data = parse_snapshot(snapshot)
+    return data, metrics.export()
+
+
+class ParsePipeline:
+    def __init__(self,
+                 sink: Callable[[int, Optional[BookingData]], None],
+                 max_workers: Optional[int] = None,
+                 max_pending: Optional[int] = None,
+                 parser_backend: str = "html.parser"):
+        self.sink = sink  # receives every parsed item, None if parsing failed
+        self.max_workers = max_workers or os.cpu_count() or 1
+        # bound the snapshots waiting in the queue, so a fast browser
+        # cannot fill up the memory with raw html
+        self.max_pending = max_pending or self.max_workers * 2
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                             initializer=_init_worker,
+                                             initargs=(parser_backend,))
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+
+    def submit(self, index: int, snapshot: HotelSnapshot) -> Future:
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(_parse, snapshot)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._done(index, f))
+        return future
+
+    def _done(self, index: int, future: Future):
+        self._slots.release()
+        try:
+            data, worker_metrics = future.result()
+            metrics.merge(worker_metrics)
+        except Exception as e:
+            print(f"\nError when parsing item {index+1}, the page layout may have " +
+                  f"changed (selectors {selector_version}). Skip. Message:\n{e}")
+            metrics.inc("hotel_parse_errors")
+            data = None
+        self.sink(index, data)
+
+    def close(self, cancel: bool = False):
+        # wait for the queued items to be parsed and passed to the sink
+        self._executor.shutdown(wait=True, cancel_futures=cancel)
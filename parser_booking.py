@@ -0,0 +1,233 @@
+import time
+from typing import Callable, Optional
+from bs4 import BeautifulSoup
+from data_model_booking import (BookingData, Review, dedup_reviews,
+                                normalize_hotel_url, user_type_mapping)
+from metrics import metrics
+from selector_booking import pattern_mapping, selector_mapping
+
+# "html.parser" (built-in) or "lxml" (faster, needs 'pip install lxml')
+parser_backend = "html.parser"
+
+
+def set_parser_backend(backend: str):
+    global parser_backend
+    if backend not in ("html.parser", "lxml"):
+        raise ValueError(f"Unknown parser backend '{backend}'.")
+    if backend == "lxml":
+        try:
+            import lxml
+        except ImportError:
+            raise ImportError(
+                "lxml parser backend requires the 'lxml' package. " +
+                "Install it with 'pip install lxml'.")
+    parser_backend = backend
+
+
+def make_soup(html: str, selector_name: Optional[str] = None) -> BeautifulSoup:
+    # with selector_name, only the matched element is built into the tree
+    if selector_name:
+        return BeautifulSoup(html, parser_backend,
+                             parse_only=selector_mapping[selector_name].strainer())
+    return BeautifulSoup(html, parser_backend)
+
+
+class HotelSnapshot:
+    def __init__(self,
+                 url: str,
+                 hotel_html: str = "",
+                 review_pages: Optional[list[str]] = None):
+        self.url = url
+        self.hotel_html = hotel_html  # page_source of hotel page
+        self.review_pages = review_pages or []  # page_source of each review page
+
+
+def parse_hotel_page(html: str) -> BookingData:
+    data = BookingData()
+    soup = make_soup(html)
+    s = selector_mapping
+
+    # basic infos
+    data.name = s["hotel_name"].find(soup).getText(strip=True)
+    print(data.name)
+    data.address = s["hotel_address"].find(soup).contents[0].getText(strip=True)
+
+    slogan_div = s["hotel_slogan"].find(soup)
+    data.slogan = slogan_div.getText() if slogan_div else None
+
+    data.description = s["hotel_description"].find(soup).getText(strip=True)
+
+    # stars
+    star_div = s["star_container"].find(soup)
+    data.star.count = len(s["star_item"].find_all(star_div))
+    if data.star.count > 0:
+        star_text = s["star_type"].find(star_div).get("data-testid")
+        data.star.type = "official" if star_text == "rating-stars" else "booking"
+
+    # ratings
+    # get overall average rating
+    average_rating_div = s["scorecard"].find(soup)
+    if not average_rating_div:
+        # if there is no review then skip
+        data.user_review.overall_rating.type = None
+        print("No review.")
+        return data
+
+    try:
+        # get average rating
+        data.user_review.overall_rating.average = (float)(
+            average_rating_div.attrs.get("data-review-score", 0))
+        data.user_review.overall_rating.type = "booking"
+    except:
+        # get external average rating
+        external_average_rating_div = s["external_rating"].find(average_rating_div)
+        external_average_rating_match = pattern_mapping["external_rating"].search(
+            external_average_rating_div.text)
+        data.user_review.overall_rating.average = float(
+            external_average_rating_match.group())
+        data.user_review.overall_rating.type = "external"
+        print("Review data is from external.")
+        return data
+
+    # get subrating
+    subrating_divs = s["subrating"].find_all(soup)
+    for subrating_div in subrating_divs[int(len(subrating_divs)/2):]:
+        key = s["subrating_key"].find(subrating_div).getText(strip=True)
+        value = float(s["subrating_value"].find(subrating_div).getText(strip=True))
+        data.user_review.overall_rating.update_subrating_by_keyword(key,
+                                                                    value)
+
+    # get total count of reviews
+    review_count_origin = s["review_count"].find(soup).text
+    data.user_review.count = int(pattern_mapping["review_count"].search(
+        review_count_origin).group(1).replace(',', ''))
+
+    return data
+
+
+def has_booking_reviews(html: str) -> bool:
+    # same decision as parse_hotel_page: review pages are crawled only if
+    # the overall rating is from booking
+    average_rating_div = selector_mapping["scorecard"].find(
+        make_soup(html, "scorecard"))
+    if not average_rating_div:
+        return False
+    try:
+        float(average_rating_div.attrs.get("data-review-score", 0))
+    except ValueError:
+        return False
+    return True
+
+
+# extractors of review fields, (field, function of review card).
+# an extractor raising an error skips the whole review
+def _text(selector_name: str, strip: bool = True) -> Callable:
+    selector = selector_mapping[selector_name]
+
+    def extract(review_div):
+        div = selector.find(review_div)
+        if not div:
+            return None
+        return div.getText(strip=True) if strip else div.text
+    return extract
+
+
+def _required(extract: Callable) -> Callable:
+    def extract_required(review_div):
+        value = extract(review_div)
+        if value is None:
+            raise AttributeError("Required review field is missing.")
+        return value
+    return extract_required
+
+
+def _num_stay_night(review_div):
+    # transform "n 晚" to "n"(int)
+    return int(selector_mapping["review_num_nights"].find(review_div).getText(
+        separator=" ", strip=True)[0])
+
+
+def _stay_date(review_div):
+    # transform "yyyy 年 MM 月" to "yyyy-MM"
+    stay_date_matched = pattern_mapping["stay_date"].search(
+        selector_mapping["review_stay_date"].find(review_div).text)
+    return f"{stay_date_matched.group(1)}-" + \
+        f"{stay_date_matched.group(2).zfill(2)}"
+
+
+def _user_type(review_div):
+    user_type_div = selector_mapping["review_traveler_type"].find(review_div)
+    return user_type_mapping[f"{user_type_div.text}"] if user_type_div else None
+
+
+def _review_date(review_div):
+    # transform "yyyy 年 MM 月 dd 日" to "yyyy-MM-dd"
+    review_date_matched = pattern_mapping["review_date"].search(
+        selector_mapping["review_date"].find(review_div).text)
+    return f"{review_date_matched.group(1)}" +\
+        f"-{review_date_matched.group(2).zfill(2)}" +\
+        f"-{review_date_matched.group(3).zfill(2)}"
+
+
+def _rating(review_div):
+    rating_div = selector_mapping["review_score"].find(review_div)
+    return float(rating_div.getText(strip=True).split('分')[-1]) \
+        if rating_div else None
+
+
+review_field_extractors = [
+    ("user_name", _required(_text("review_user_name"))),
+    ("country", _text("review_country")),
+    ("room_name", _required(_text("review_room_name"))),
+    ("num_stay_night", _num_stay_night),
+    ("stay_date", _stay_date),
+    ("user_type", _user_type),
+    ("review_date", _review_date),
+    ("title", _text("review_title", strip=False)),
+    ("positive_description", _text("review_positive_text")),
+    ("negative_description", _text("review_negative_text")),
+    ("rating", _rating)
+]
+
+
+def parse_review_div(review_div) -> Review:
+    values = dict()
+    for field, extract in review_field_extractors:
+        start_time = time.perf_counter()
+        values[field] = extract(review_div)
+        metrics.observe(f"parse.field.{field}", time.perf_counter() - start_time)
+    return Review(**values)
+
+
+def parse_review_page(html: str) -> list[Review]:
+    # only the review list is built into the tree, not the hotel page behind
+    review_section = selector_mapping["review_list"].find(
+        make_soup(html, "review_list"))
+    current_review_divs = selector_mapping["review_card"].find_all(review_section)
+
+    reviews = list()
+    for review_div in current_review_divs:
+        try:
+            reviews.append(parse_review_div(review_div))
+        except Exception as e:
+            print(f"Error when getting an review. Skip and continue. Message:\n{e}")
+            metrics.inc("review_parse_errors")
+            continue
+    return reviews
+
+
+def parse_snapshot(snapshot: HotelSnapshot) -> BookingData:
+    with metrics.timer("parse.hotel_page"):
+        data = parse_hotel_page(snapshot.hotel_html)
+    data.url = normalize_hotel_url(snapshot.url)
+    if data.user_review.overall_rating.type != "booking":
+        return data
+
+    # new reviews arriving while paginating shift the pages, so a review
+    # can be captured on two pages
+    seen = set()
+    for html in snapshot.review_pages:
+        with metrics.timer("parse.review_page"):
+            reviews = parse_review_page(html)
+        data.user_review.reviews.extend(dedup_reviews(reviews, seen))
+    return data
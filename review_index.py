@@ -0,0 +1,146 @@
+import argparse
+import sqlite3
+import threading
+import time
+from typing import Optional
+from data_model_booking import BookingData, Review, normalize_hotel_url
+from incremental import read_dataset
+
+
+class ReviewIndex:
+    # persistent index of the reviews saved by every run, per hotel url and
+    # Review.content_hash(), so a review is written to the results only once
+    def __init__(self, path: str = "result/review_index.sqlite"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS reviews (
+                hotel_url TEXT NOT NULL,
+                review_hash TEXT NOT NULL,
+                review_date TEXT,
+                first_seen REAL NOT NULL,
+                PRIMARY KEY (hotel_url, review_hash)
+            ) WITHOUT ROWID;
+        ''')
+        self._conn.commit()
+        self.skipped_count = 0  # duplicates dropped in this run
+        # hashes of records not written yet, per record key and per hotel url
+        self._pending: dict = {}
+        self._reserved: dict[str, set[str]] = {}
+
+    def hashes(self, url: str) -> set[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT review_hash FROM reviews WHERE hotel_url = ?',
+                (normalize_hotel_url(url),)).fetchall()
+        return {row[0] for row in rows}
+
+    def add(self, url: str, reviews: list[Review]) -> list[Review]:
+        # record the reviews, return only the ones not seen before, in order
+        url = normalize_hotel_url(url)
+        new_reviews = list()
+        now = time.time()
+        with self._lock:
+            for review in reviews:
+                cursor = self._conn.execute(
+                    'INSERT OR IGNORE INTO reviews VALUES (?, ?, ?, ?)',
+                    (url, review.content_hash(), review.review_date, now))
+                if cursor.rowcount:
+                    new_reviews.append(review)
+            self._conn.commit()
+        self.skipped_count += len(reviews) - len(new_reviews)
+        return new_reviews
+
+    def select(self, key, url: str, reviews: list[Review]) -> list[Review]:
+        # the reviews not indexed and not selected for another record, in order.
+        # their hashes are reserved for the record key, and indexed by commit
+        # once the record is written, so a crash before cannot lose them
+        url = normalize_hotel_url(url)
+        hashes = {review.content_hash(): review for review in reviews}
+        with self._lock:
+            indexed = set()
+            items = list(hashes)
+            for i in range(0, len(items), 500):  # sqlite variable limit
+                chunk = items[i:i+500]
+                indexed.update(row[0] for row in self._conn.execute(
+                    'SELECT review_hash FROM reviews WHERE hotel_url = ? AND ' +
+                    f'review_hash IN ({", ".join("?" * len(chunk))})',
+                    (url, *chunk)).fetchall())
+            reserved = self._reserved.setdefault(url, set())
+            _, pending = self._pending.setdefault(key, (url, []))
+            new_reviews = list()
+            for review in reviews:
+                review_hash = review.content_hash()
+                if review_hash in indexed or review_hash in reserved:
+                    continue
+                reserved.add(review_hash)
+                pending.append((review_hash, review.review_date))
+                new_reviews.append(review)
+        self.skipped_count += len(reviews) - len(new_reviews)
+        return new_reviews
+
+    def commit(self, key):
+        # the record of key is written, index its reviews
+        now = time.time()
+        with self._lock:
+            if key not in self._pending:
+                return
+            url, pending = self._pending.pop(key)
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO reviews VALUES (?, ?, ?, ?)',
+                [(url, review_hash, review_date, now)
+                 for review_hash, review_date in pending])
+            self._conn.commit()
+            self._reserved[url].difference_update(h for h, _ in pending)
+
+    def discard(self, key):
+        # the record of key will not be written (or is crawled again)
+        with self._lock:
+            if key not in self._pending:
+                return
+            url, pending = self._pending.pop(key)
+            self._reserved[url].difference_update(h for h, _ in pending)
+
+    def filter(self, key, data: BookingData) -> BookingData:
+        # keep only the reviews of the hotel not saved by a previous run
+        data.user_review.reviews = self.select(key, data.url, data.user_review.reviews)
+        return data
+
+    def import_dataset(self, path: str) -> int:
+        # index the reviews of an existing result, number of reviews added
+        count = 0
+        for record in read_dataset(path):
+            reviews = [Review.from_dict(review)
+                       for review in (record.get("user_review") or {}).get("reviews") or []]
+            if record.get("url"):
+                count += len(self.add(record["url"], reviews))
+        self.skipped_count = 0
+        return count
+
+    def count(self, url: Optional[str] = None) -> int:
+        with self._lock:
+            if url:
+                return self._conn.execute(
+                    'SELECT COUNT(*) FROM reviews WHERE hotel_url = ?',
+                    (normalize_hotel_url(url),)).fetchone()[0]
+            return self._conn.execute('SELECT COUNT(*) FROM reviews').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Add the reviews of an existing result to the review index.")
+    parser.add_argument("input", type=str,
+                        help="Path of .json, .jsonl, .jsonl.gz or .jsonl.zst result.")
+    parser.add_argument("-i", "--index", type=str,
+                        help="Path of review index.", default="result/review_index.sqlite")
+    args = parser.parse_args()
+
+    review_index = ReviewIndex(args.index)
+    print(f"{review_index.import_dataset(args.input)} reviews added to '{args.index}'. " +
+          f"{review_index.count()} reviews indexed.")
+    review_index.close()
@@ -0,0 +1,82 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, Optional
+from urllib.parse import urljoin
+from data_model_booking import normalize_hotel_url
+from http_fetcher import ContentMissingError, HttpFetcher, check_blocked
+from parser_booking import make_soup
+from selector_booking import selector_mapping
+
+results_per_page = 25  # hotels of one search result page at an offset
+
+
+def search_page_url(url_query: str, page: int) -> str:
+    return url_query + f"&offset={page * results_per_page}"
+
+
+def extract_result_links(page_url: str, html: str) -> list[str]:
+    soup = make_soup(html, "search_result_link")
+    return [urljoin(page_url, link.get("href"))
+            for link in selector_mapping["search_result_link"].find_all(soup)
+            if link.get("href")]
+
+
+def is_result_page(html: str) -> bool:
+    # a rendered result page, with or without result
+    return selector_mapping["search_result_header"].find(
+        make_soup(html, "search_result_header")) is not None
+
+
+def get_result_links_over_http(fetcher: HttpFetcher, page_url: str) -> list[str]:
+    html = fetcher.get(page_url)
+    links = extract_result_links(page_url, html)
+    if not links:
+        check_blocked(page_url, html, "search_result_link")
+        if not is_result_page(html):
+            raise ContentMissingError(page_url, message="Search results are missing.")
+    return links
+
+
+def iter_search_results(get_links: Callable[[str], list[str]],
+                        url_query: str,
+                        max_item: int,
+                        window: int = 4,
+                        known: Optional[list[str]] = None) -> Iterator[list[str]]:
+    # request result pages by offset, window pages at a time in parallel,
+    # and yield the new hotel urls of every page as soon as it and the pages
+    # before it are done. stop at the first page without result.
+    # known urls (harvested before an interruption) are not yielded again,
+    # the harvest continues at the page after them
+    max_pages = -(-max_item // results_per_page)
+    seen = {normalize_hotel_url(url) for url in known or []}
+    count = len(seen)
+    next_page = count // results_per_page
+    with ThreadPoolExecutor(max_workers=window) as executor:
+        futures = deque()
+        try:
+            while True:
+                while len(futures) < window and next_page < max_pages:
+                    futures.append(executor.submit(
+                        get_links, search_page_url(url_query, next_page)))
+                    next_page += 1
+                if not futures:
+                    return
+                links = futures.popleft().result()
+                if not links:
+                    return  # last result page reached, get_links raises if not loaded
+                # results shift between requests, a hotel can be on two pages
+                urls = list()
+                for url in links:
+                    key = normalize_hotel_url(url)
+                    if key not in seen:
+                        seen.add(key)
+                        urls.append(url)
+                urls = urls[:max_item - count]
+                count += len(urls)
+                if urls:
+                    yield urls
+                if count >= max_item:
+                    return
+        finally:
+            for future in futures:
+                future.cancel()
@@ -0,0 +1,113 @@
+import re
+from typing import Optional
+from bs4 import SoupStrainer
+
+# layout of booking.com (zh-tw) pages the selectors below are written for.
+# booking.com renames its hashed class names from time to time, update the
+# table and bump the version when the crawler stops finding elements.
+selector_version = "2025-01"
+
+
+class Selector:
+    def __init__(self,
+                 tag: Optional[str] = None,
+                 class_: Optional[str] = None,
+                 id: Optional[str] = None,
+                 attrs: Optional[dict] = None):
+        self.tag = tag
+        self.class_ = class_
+        self.id = id
+        self.attrs = dict(attrs or {})
+        if class_:
+            self.attrs["class"] = class_
+        if id:
+            self.attrs["id"] = id
+        self.css = self._build_css()
+        self.marker = class_.split()[0] if class_ else id  # quick check on raw html
+
+    def _build_css(self) -> str:
+        css = self.tag or ""
+        if self.id:
+            css += f"#{self.id}"
+        if self.class_:
+            css += "".join(f".{name}" for name in self.class_.split())
+        for key, value in self.attrs.items():
+            if key not in ("class", "id"):
+                css += f'[{key}="{value}"]'
+        return css
+
+    def find(self, soup):
+        return soup.find(self.tag, self.attrs)
+
+    def find_all(self, soup):
+        return soup.find_all(self.tag, self.attrs)
+
+    def strainer(self) -> SoupStrainer:
+        # parse only this element (and its children) of a page
+        return SoupStrainer(self.tag, self.attrs)
+
+
+selector_mapping = {
+    # search result page
+    "search_result_link": Selector("a", class_="a78ca197d0"),
+    # heading of a rendered result page ("...: N properties found"), also on
+    # a page past the last result
+    "search_result_header": Selector("h1", attrs={"aria-live": "assertive"}),
+    "first_visit_dialog_close": Selector(
+        class_="a83ed08757 c21c56c305 f38b6daa18 d691166b09 ab98298258 f4552b6561"),
+    "load_more_button": Selector(
+        class_="a83ed08757 c21c56c305 bf0537ecb5 f671049264 af7297d90d c0e0affd09"),
+
+    # hotel page
+    "hotel_name": Selector("h2", class_="pp-header__title"),
+    "hotel_address": Selector("div", class_="a53cbfa6de f17adf7576"),
+    "hotel_slogan": Selector("h3", class_="e1eebb6a1e b484330d89"),
+    "hotel_description": Selector("p", class_="a53cbfa6de b3efd73f69"),
+    "star_container": Selector("span", class_="hp__hotel_ratings"),
+    "star_item": Selector("span", class_="fcd9eec8fb d31eda6efc c25361c37f"),
+    "star_type": Selector("span", class_="a455730030 d542f184f1"),
+    "scorecard": Selector("div", id="js--hp-gallery-scorecard"),
+    "external_rating": Selector("div", class_="a3b8729ab1 e6208ee469 cb2cbb3ccb"),
+    "subrating": Selector(
+        "div", class_="c624d7469d f034cf5568 c69ad9b0c2 b57676889b c6198b324c a3214e5942"),
+    "subrating_key": Selector("span", class_="be887614c2"),
+    "subrating_value": Selector("div", class_="ccb65902b2 bdc1ea4a28"),
+    "review_count": Selector("div", class_="abf093bdfe f45d8e4c32 d935416c47"),
+    "reviews_tab": Selector(id="reviews-tab-trigger"),
+
+    # review sidebar
+    "review_list": Selector("div", class_="b89e77822a"),
+    "review_card": Selector("div", class_="d799cd346c"),
+    "next_page_button": Selector("button", attrs={"aria-label": "下一頁"}),
+    "review_sort_trigger": Selector(attrs={"data-testid": "sorters-dropdown-trigger"}),
+    "review_sort_newest": Selector(attrs={"data-id": "NEWEST_FIRST"}),
+    "review_user_name": Selector("div", class_="a3332d346a e6208ee469"),
+    "review_country": Selector("span", class_="afac1f68d9 a1ad95c055"),
+    "review_room_name": Selector("span", attrs={"data-testid": "review-room-name"}),
+    "review_num_nights": Selector("span", attrs={"data-testid": "review-num-nights"}),
+    "review_stay_date": Selector("span", class_="abf093bdfe d88f1120c1"),
+    "review_traveler_type": Selector("span", attrs={"data-testid": "review-traveler-type"}),
+    "review_date": Selector("span", class_="abf093bdfe f45d8e4c32"),
+    "review_title": Selector("h3", attrs={"data-testid": "review-title"}),
+    "review_positive_text": Selector("div", attrs={"data-testid": "review-positive-text"}),
+    "review_negative_text": Selector("div", attrs={"data-testid": "review-negative-text"}),
+    "review_score": Selector("div", attrs={"data-testid": "review-score"})
+}
+
+# raw html of the challenge (captcha) pages served instead of the content
+# when the crawler is blocked
+block_page_markers = ("gokuProps", "awsWafCookieDomainList", "challenge-container",
+                      "captcha-container", "g-recaptcha", "h-captcha", "px-captcha",
+                      "cf-chl", "/_sec/cp_challenge", "Access Denied")
+
+# compiled once at import
+pattern_mapping = {
+    "external_rating": re.compile(r'\d+(\.\d+)?$'),
+    "review_count": re.compile(r'(\d[\d,]*)'),
+    "stay_date": re.compile(r'(\d{4}) 年 (\d{1,2}) 月'),  # "yyyy 年 MM 月"
+    "review_date": re.compile(r'(\d{4}) 年 (\d{1,2}) 月 (\d{1,2}) 日')  # "yyyy 年 MM 月 dd 日"
+}
+
+# css selector of review cards in review sidebar, used by the browser side
+review_card_css = f"{selector_mapping['review_list'].css} " + \
+    f"{selector_mapping['review_card'].css}"
@@ -0,0 +1,128 @@
+import threading
+import time
+from typing import Callable, Optional
+from selenium import webdriver
+from selenium.common.exceptions import (NoSuchElementException,
+                                        StaleElementReferenceException,
+                                        TimeoutException)
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from metrics import metrics
+
+# fixed sleeps used before the wait engine, to report the idle time removed
+fixed_sleep_mapping = {
+    "search_results": 5,
+    "scroll": 3,
+    "load_more": 3,
+    "hotel_header": 5,
+    "review_list": 3,
+    "review_page": 2
+}
+
+
+# conditions, each returns a truthy value as soon as the page is ready
+def element_present(css_selector: str) -> Callable:
+    def condition(driver: webdriver.Chrome):
+        elements = driver.find_elements(By.CSS_SELECTOR, css_selector)
+        return elements[0] if elements else False
+    return condition
+
+
+def page_height_changed(previous_height: int) -> Callable:
+    def condition(driver: webdriver.Chrome):
+        return driver.execute_script(
+            'return document.body.scrollHeight') != previous_height
+    return condition
+
+
+def element_count_increased(css_selector: str, previous_count: int) -> Callable:
+    def condition(driver: webdriver.Chrome):
+        return len(driver.find_elements(By.CSS_SELECTOR,
+                                        css_selector)) > previous_count
+    return condition
+
+
+def first_element_text(driver: webdriver.Chrome, css_selector: str) -> Optional[str]:
+    try:
+        return driver.find_element(By.CSS_SELECTOR, css_selector).text
+    except (NoSuchElementException, StaleElementReferenceException):
+        return None
+
+
+def first_element_text_changed(css_selector: str, previous_text: Optional[str]) -> Callable:
+    def condition(driver: webdriver.Chrome):
+        text = first_element_text(driver, css_selector)
+        return text is not None and text != previous_text
+    return condition
+
+
+class WaitEngine:
+    def __init__(self,
+                 timeout: float = 10,
+                 settle_timeout: float = 3,
+                 poll_frequency: float = 0.1):
+        self.timeout = timeout  # worst case for content that should appear
+        self.settle_timeout = settle_timeout  # worst case for content that may not change
+        self.poll_frequency = poll_frequency
+        self.records: dict[str, list[float]] = {}
+        self.timeouts: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def until(self,
+              driver: webdriver.Chrome,
+              name: str,
+              condition: Callable,
+              timeout: Optional[float] = None):
+        # wait until condition holds, return its value or False on timeout
+        start_time = time.perf_counter()
+        try:
+            result = WebDriverWait(
+                driver,
+                self.timeout if timeout is None else timeout,
+                poll_frequency=self.poll_frequency,
+                ignored_exceptions=(NoSuchElementException,
+                                    StaleElementReferenceException)
+            ).until(condition)
+        except TimeoutException:
+            result = False
+            with self._lock:
+                self.timeouts[name] = self.timeouts.get(name, 0) + 1
+        self.record(name, time.perf_counter() - start_time)
+        return result
+
+    def settle(self, driver: webdriver.Chrome, name: str, condition: Callable):
+        return self.until(driver, name, condition, self.settle_timeout)
+
+    def record(self, name: str, elapsed: float):
+        with self._lock:
+            self.records.setdefault(name, []).append(elapsed)
+        metrics.observe(f"wait.{name}", elapsed)
+
+    def summary(self) -> dict:
+        result = dict()
+        with self._lock:
+            for name, elapsed_list in self.records.items():
+                waited = sum(elapsed_list)
+                fixed = fixed_sleep_mapping.get(name, 0) * len(elapsed_list)
+                result[name] = {
+                    "count": len(elapsed_list),
+                    "timeouts": self.timeouts.get(name, 0),
+                    "total": round(waited, 3),
+                    "average": round(waited / len(elapsed_list), 3),
+                    "max": round(max(elapsed_list), 3),
+                    "saved": round(fixed - waited, 3)
+                }
+        return result
+
+    def print_summary(self):
+        summary = self.summary()
+        if not summary:
+            return
+        print("Wait summary:")
+        for name, item in summary.items():
+            print(f"  {name}: {item['count']} waits, " +
+                  f"total {item['total']}s, avg {item['average']}s, " +
+                  f"max {item['max']}s, timeouts {item['timeouts']}, " +
+                  f"saved {item['saved']}s")
+        print(f"  Total idle time saved vs fixed sleeps: " +
+              f"{round(sum(item['saved'] for item in summary.values()), 3)}s")
@@ -0,0 +1,305 @@
+import argparse
+import codecs
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Iterator, Optional
+
+
+class WorkQueue:
+    # durable queue of hotel urls shared by a coordinator and the workers of
+    # every node, in one sqlite file (on a disk or share they all reach).
+    # workers lease a task for lease_seconds and keep it by heartbeats, a
+    # task whose lease expired (crashed worker) is queued again.
+    # the rollback journal is used, not WAL: WAL keeps its index in shared
+    # memory of one host and breaks when nodes open the file over a share
+    def __init__(self, path: str = "result/work_queue.sqlite"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=DELETE')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_key TEXT PRIMARY KEY,
+                query TEXT NOT NULL,
+                harvested INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_key TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                url TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                worker TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result BLOB,
+                collected INTEGER NOT NULL DEFAULT 0,
+                UNIQUE (job_key, idx)
+            );
+            CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, task_id);
+        ''')
+
+    def _execute(self, sql: str, params: tuple = ()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _transaction(self, func):
+        # BEGIN IMMEDIATE takes the write lock of the file, so two nodes
+        # never lease the same task
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = func(self._conn)
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+            return result
+
+    # coordinator side
+
+    def create_job(self, job_key: str, query: dict):
+        # a new job, forgetting the tasks of any previous job of the same key
+        def create(conn):
+            conn.execute('DELETE FROM tasks WHERE job_key = ?', (job_key,))
+            conn.execute('INSERT OR REPLACE INTO jobs VALUES (?, ?, 0, ?)',
+                         (job_key, json.dumps(query, ensure_ascii=False), time.time()))
+        self._transaction(create)
+
+    def has_job(self, job_key: str) -> bool:
+        return bool(self._execute('SELECT 1 FROM jobs WHERE job_key = ?', (job_key,)))
+
+    def is_harvested(self, job_key: str) -> bool:
+        return bool(self._execute(
+            'SELECT 1 FROM jobs WHERE job_key = ? AND harvested = 1', (job_key,)))
+
+    def add_urls(self, job_key: str, first_idx: int, urls: list[str]):
+        self._transaction(lambda conn: conn.executemany(
+            'INSERT OR IGNORE INTO tasks (job_key, idx, url) VALUES (?, ?, ?)',
+            [(job_key, first_idx + i, url) for i, url in enumerate(urls)]))
+
+    def finish_harvest(self, job_key: str):
+        self._execute('UPDATE jobs SET harvested = 1 WHERE job_key = ?', (job_key,))
+
+    def get_urls(self, job_key: str) -> list[str]:
+        rows = self._execute('SELECT url FROM tasks WHERE job_key = ? ORDER BY idx',
+                             (job_key,))
+        return [row[0] for row in rows]
+
+    def get_collected(self, job_key: str) -> set[int]:
+        rows = self._execute(
+            'SELECT idx FROM tasks WHERE job_key = ? AND collected = 1', (job_key,))
+        return {row[0] for row in rows}
+
+    def get_results(self, job_key: str, exclude: set[int]) -> list[tuple[int, Optional[bytes]]]:
+        # (idx, compressed json line or None if failed) of the finished tasks
+        # not collected yet, except the exclude ones (fetched by a previous
+        # call, waiting to be written), whose results are not loaded again
+        return self._execute(
+            'SELECT idx, result FROM tasks WHERE job_key = ? AND collected = 0 ' +
+            "AND status IN ('done', 'failed') " +
+            'AND idx NOT IN (SELECT value FROM json_each(?)) ORDER BY idx',
+            (job_key, json.dumps(sorted(exclude))))
+
+    def mark_collected(self, job_key: str, idx: int):
+        # the record is in the result file, its copy in the queue is dropped
+        self._execute('UPDATE tasks SET collected = 1, result = NULL ' +
+                      'WHERE job_key = ? AND idx = ?', (job_key, idx))
+
+    def is_finished(self, job_key: str) -> bool:
+        # harvested and every task done or failed
+        return self.is_harvested(job_key) and not self._execute(
+            'SELECT 1 FROM tasks WHERE job_key = ? ' +
+            "AND status NOT IN ('done', 'failed') LIMIT 1", (job_key,))
+
+    # worker side
+
+    def has_open_job(self) -> bool:
+        # a job still harvesting, or with tasks not done or failed
+        return bool(self._execute(
+            'SELECT 1 FROM jobs WHERE harvested = 0 OR EXISTS (' +
+            'SELECT 1 FROM tasks WHERE tasks.job_key = jobs.job_key ' +
+            "AND status NOT IN ('done', 'failed')) LIMIT 1"))
+
+    def lease(self, worker: str, lease_seconds: float) -> Optional[tuple[int, str]]:
+        # (task_id, url) of the oldest queued task, None if nothing is queued
+        def lease(conn):
+            now = time.time()
+            conn.execute("UPDATE tasks SET status = 'queued', worker = NULL " +
+                         "WHERE status = 'leased' AND lease_until < ?", (now,))
+            row = conn.execute("SELECT task_id, url FROM tasks WHERE status = 'queued' " +
+                               'ORDER BY task_id LIMIT 1').fetchone()
+            if row:
+                conn.execute("UPDATE tasks SET status = 'leased', worker = ?, " +
+                             'lease_until = ?, attempts = attempts + 1 ' +
+                             'WHERE task_id = ?', (worker, now + lease_seconds, row[0]))
+            return row
+        return self._transaction(lease)
+
+    def heartbeat(self, worker: str, task_ids: list[int], lease_seconds: float):
+        self._transaction(lambda conn: conn.executemany(
+            'UPDATE tasks SET lease_until = ? ' +
+            "WHERE task_id = ? AND worker = ? AND status = 'leased'",
+            [(time.time() + lease_seconds, task_id, worker) for task_id in task_ids]))
+
+    def complete(self, task_id: int, result: bytes):
+        # first result wins, a late worker whose lease expired does not
+        # overwrite the result of the worker that took the task over
+        self._execute("UPDATE tasks SET status = 'done', result = ?, worker = NULL " +
+                      "WHERE task_id = ? AND status != 'done'", (result, task_id))
+
+    def fail(self, worker: str, task_id: int, max_attempts: int):
+        # queued again until max_attempts leases failed
+        self._execute("UPDATE tasks SET worker = NULL, status = CASE " +
+                      "WHEN attempts >= ? THEN 'failed' ELSE 'queued' END " +
+                      "WHERE task_id = ? AND worker = ? AND status = 'leased'",
+                      (max_attempts, task_id, worker))
+
+    def release(self, worker: str, task_ids: list[int]):
+        # give back leases of tasks not finished (stop by user)
+        self._transaction(lambda conn: conn.executemany(
+            "UPDATE tasks SET status = 'queued', worker = NULL, " +
+            "attempts = attempts - 1 WHERE task_id = ? AND worker = ? " +
+            "AND status = 'leased'",
+            [(task_id, worker) for task_id in task_ids]))
+
+    def stats(self, job_key: Optional[str] = None) -> dict[str, int]:
+        rows = self._execute(
+            'SELECT status, COUNT(*) FROM tasks ' +
+            ('WHERE job_key = ? ' if job_key else '') + 'GROUP BY status',
+            (job_key,) if job_key else ())
+        return dict(rows)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def compress_record(record) -> bytes:
+    # json line of a record dict or HotelRecordSpool, compressed piece by
+    # piece so a spooled hotel is never built in memory
+    compressor = zlib.compressobj()
+    chunks = record.chunks() if hasattr(record, "chunks") else \
+        [json.dumps(record, ensure_ascii=False) + "\n"]
+    result = b"".join(compressor.compress(chunk.encode("utf8")) for chunk in chunks)
+    if hasattr(record, "remove"):
+        record.remove()
+    return result + compressor.flush()
+
+
+class QueuedRecord:
+    # finished record of a worker, written into the result by the coordinator
+    # (through OrderedRecordWriter, like a HotelRecordSpool)
+    def __init__(self, result: bytes):
+        self.result = result
+
+    def chunks(self, size: int = 1024 * 1024) -> Iterator[str]:
+        decompressor = zlib.decompressobj()
+        decoder = codecs.getincrementaldecoder("utf8")()
+        for i in range(0, len(self.result), size):
+            yield decoder.decode(decompressor.decompress(self.result[i:i+size]))
+        yield decoder.decode(decompressor.flush(), final=True)
+
+    def write_to(self, writer):
+        writer.write_chunks(self.chunks())
+
+
+class QueueWorker:
+    # tasks of the queue crawled by one node. leases at most slots tasks at
+    # a time and heartbeats them in a thread. stands in for the
+    # OrderedRecordWriter of a local crawl: put / skip finish a task
+    def __init__(self,
+                 queue: WorkQueue,
+                 slots: int,
+                 lease_seconds: float = 60,
+                 max_attempts: int = 3,
+                 poll_interval: float = 2):
+        self.queue = queue
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.done_count = 0
+        self.failed_count = 0
+        self._slots = threading.BoundedSemaphore(slots)
+        self._leased: dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat, daemon=True)
+        self._heartbeat_thread.start()
+
+    def _heartbeat(self):
+        while not self._stopped.wait(self.lease_seconds / 3):
+            with self._lock:
+                task_ids = list(self._leased)
+            if task_ids:
+                try:
+                    self.queue.heartbeat(self.worker_id, task_ids, self.lease_seconds)
+                except sqlite3.Error as e:
+                    print(f"\nHeartbeat failed. Retry. Message:\n{e}")
+
+    def iter_tasks(self) -> Iterator[tuple[int, str]]:
+        # (task_id, url) whenever a slot is free, until no job is open
+        while not self._stopped.is_set():
+            self._slots.acquire()
+            task = self.queue.lease(self.worker_id, self.lease_seconds)
+            if task:
+                with self._lock:
+                    self._leased[task[0]] = task[1]
+                yield task
+                continue
+            self._slots.release()
+            if not self.queue.has_open_job():
+                return
+            time.sleep(self.poll_interval)  # harvest in progress or tasks leased
+
+    def _finish(self, task_id: int):
+        with self._lock:
+            self._leased.pop(task_id, None)
+        self._slots.release()
+
+    def put(self, task_id: int, record):
+        if record is None:
+            self.skip(task_id)
+            return
+        self.queue.complete(task_id, compress_record(record))
+        self.done_count += 1
+        self._finish(task_id)
+
+    def skip(self, task_id: int):
+        self.queue.fail(self.worker_id, task_id, self.max_attempts)
+        self.failed_count += 1
+        self._finish(task_id)
+
+    def flush_pending(self):
+        None  # every record is sent when it is finished
+
+    def close(self):
+        self._stopped.set()
+        self._heartbeat_thread.join()
+        with self._lock:
+            task_ids = list(self._leased)
+        self.queue.release(self.worker_id, task_ids)
+        print(f"Worker '{self.worker_id}': {self.done_count} items done, " +
+              f"{self.failed_count} failed, {len(task_ids)} given back.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the state of a work queue.")
+    parser.add_argument("path", type=str, nargs="?",
+                        help="Path of work queue.", default="result/work_queue.sqlite")
+    args = parser.parse_args()
+
+    queue = WorkQueue(args.path)
+    for job_key, harvested in queue._execute('SELECT job_key, harvested FROM jobs'):
+        counts = queue.stats(job_key)
+        print(f"'{job_key}': " + ("harvested" if harvested else "harvesting") + ", " +
+              ", ".join(f"{count} {status}" for status, count in sorted(counts.items())))
+    queue.close()